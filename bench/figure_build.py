@@ -0,0 +1,113 @@
+"""
+Per-call chart figure cost: the go.Figure + update_layout build make_figure
+used to do ("before", kept inline below) against src.app.make_figure's
+prebuilt FIGURE_LAYOUT dict ("after"), each timed through to the JSON dash
+sends (plotly's to_json_plotly, orjson when installed).
+
+    python bench/figure_build.py [repeats]
+
+Uses a synthetic series, so it needs no network.
+"""
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# keep the app's import-time cache/snapshot work away from real data
+_tmp = tempfile.mkdtemp(prefix="figure-bench-")
+os.environ.setdefault("HISTORY_CACHE_DIR", f"{_tmp}/history")
+os.environ.setdefault("MEMO_SNAPSHOT_PATH", f"{_tmp}/memo-snapshot.arrow")
+os.environ.setdefault("PREFETCH", "0")
+os.environ.setdefault("BACKGROUND_FETCH", "0")
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+from plotly.io.json import config as json_config, to_json_plotly
+
+from src.app import figure_parts, make_figure
+
+
+def make_figure_before(s, ticker, scale="linear", kind="line", overlays=None, width=None):
+    parts = figure_parts(s, ticker, scale=scale, kind=kind, overlays=overlays, width=width)
+    fig = go.Figure(parts["data"])
+    fig.update_layout(
+        title=parts["title"],
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)",
+        template=None,
+        hovermode="x unified",
+        hoverdistance=30,
+        spikedistance=-1,
+        margin=dict(l=56, r=24, t=60, b=56),
+        font=dict(color="#a5b4fc"),
+        hoverlabel=dict(
+            bgcolor="rgba(17,24,39,0.92)",
+            bordercolor="rgba(99,102,241,0.35)",
+            font=dict(color="#e5e7eb", size=12),
+            align="left",
+            namelength=-1,
+        ),
+        uirevision="keep",
+    )
+    fig.update_xaxes(
+        type="date",
+        tickformat=parts["x_tickformat"],
+        tickfont=dict(color="#a5b4fc"),
+        title_text="Date",
+        title_font=dict(color="#a5b4fc"),
+        gridcolor="rgba(99,102,241,0.08)",
+        zeroline=False,
+        showspikes=False,
+        rangeslider=dict(visible=parts["rangeslider"]),
+        rangebreaks=[dict(bounds=["sat", "mon"])],
+    )
+    fig.update_yaxes(
+        type=parts["scale"],
+        tickprefix="$",
+        tickformat=".0f",
+        tickfont=dict(color="#a5b4fc"),
+        title=dict(text="Close", standoff=20),
+        title_font=dict(color="#a5b4fc"),
+        gridcolor="rgba(99,102,241,0.08)",
+        zeroline=False,
+        showspikes=False,
+    )
+    return fig
+
+
+def series(n: int, freq: str) -> pd.Series:
+    idx = pd.date_range("2024-01-02 09:30", periods=n, freq=freq)
+    return pd.Series(100 + np.cumsum(np.random.default_rng(0).normal(0, 0.5, n)), index=idx, name="Close")
+
+
+def best_ms(fn, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        t = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t)
+    return best * 1e3
+
+
+def main() -> None:
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    cases = [
+        ("3m daily, line", series(63, "B"), {}),
+        ("2y daily, area + SMAs", series(504, "B"), dict(kind="area", overlays=["sma20", "sma50"])),
+        ("60d 5m, 1200px", series(4680, "5min"), dict(width=1200)),
+    ]
+    print(f"JSON engine: {json_config.default_engine}, best of {repeats}")
+    print(f"{'case':<24}{'before ms':>11}{'after ms':>10}{'before KB':>11}{'after KB':>10}")
+    for name, s, kw in cases:
+        before = lambda: to_json_plotly(make_figure_before(s, "TEST", **kw))
+        after = lambda: to_json_plotly(make_figure(s, "TEST", **kw))
+        before(), after()  # warm plotly's lazy imports
+        print(f"{name:<24}{best_ms(before, repeats):>11.2f}{best_ms(after, repeats):>10.2f}"
+              f"{len(before()) / 1024:>11.1f}{len(after()) / 1024:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
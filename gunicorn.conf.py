@@ -0,0 +1,34 @@
+"""
+Gunicorn settings (Procfile / render.yaml run `gunicorn -c gunicorn.conf.py src.app:server`).
+
+With preload the master imports src.app once, warms the history caches and
+plotly's figure machinery (src.app.warm_start), and only then forks the
+workers, which share those pages copy-on-write instead of each importing
+pandas/plotly/yfinance and starting with an empty cache.
+"""
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", 2))
+preload_app = os.environ.get("PRELOAD", "1") != "0"
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 60))
+
+# Threaded workers: a request waiting on Yahoo parks one thread on the fetch
+# pool's future while the others keep answering from the caches. Upstream
+# I/O goes through curl, which gevent/eventlet cannot monkeypatch, so a
+# greenlet worker would stall its whole loop on every download instead.
+worker_class = os.environ.get("WORKER_CLASS", "gthread")
+threads = int(os.environ.get("WORKER_THREADS", 16))
+
+def when_ready(server):
+    # sockets are bound, workers not yet forked: requests queue until warm-up is done
+    if preload_app:
+        from src.app import warm_start
+        warm_start()
+
+def post_fork(server, worker):
+    # background threads never survive fork, so each worker offers to run the
+    # prefetcher; the host-wide lock lets exactly one of them do it
+    from src.app import start_prefetcher, start_snapshotter
+    start_prefetcher()
+    start_snapshotter()
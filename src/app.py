@@ -1,10 +1,37 @@
+import atexit
 import datetime as dt
+import gc
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import struct
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from zoneinfo import ZoneInfo
+try:
+    import fcntl  # POSIX; cross-process cache locks are skipped without it
+except ImportError:
+    fcntl = None
+import numpy as np
 import pandas as pd
+import pyarrow as pa
 import yfinance as yf
+from yfinance.exceptions import YFTickerMissingError
 from dash import ctx
 import dash
-from dash import dcc, html, Input, Output
+from dash import dcc, html, Input, Output, State, Patch
+from dash.exceptions import PreventUpdate
 import plotly.graph_objects as go
+from plotly.io.json import to_json_plotly
 
 # ---------- Dash app ----------
 app = dash.Dash(__name__)
@@ -122,136 +149,1652 @@ app.index_string = """
 # Data helpers
 # ------------------------------------------------------------
 DEFAULT_TICKER = "AAPL"
+TICKER_OPTIONS = [
+    {"label": "Apple (AAPL)", "value": "AAPL"},
+    {"label": "Microsoft (MSFT)", "value": "MSFT"},
+    {"label": "Alphabet (GOOGL)", "value": "GOOGL"},
+    {"label": "Amazon (AMZN)", "value": "AMZN"},
+    {"label": "NVIDIA (NVDA)", "value": "NVDA"},
+    {"label": "Tesla (TSLA)", "value": "TSLA"},
+    {"label": "Meta (META)", "value": "META"},
+    {"label": "S&P 500 (SPY)", "value": "SPY"},
+    {"label": "NASDAQ 100 (QQQ)", "value": "QQQ"},
+]
 TODAY = dt.date.today()
 ACCENT = "#6366f1"  # indigo-500
 
-def get_last_trading_day(date: dt.date) -> dt.date:
-    """Return the most recent weekday (Sat/Sun -> Friday)."""
-    if date.weekday() == 5:
-        return date - dt.timedelta(days=1)
-    if date.weekday() == 6:
-        return date - dt.timedelta(days=2)
-    return date
-
 def pick_interval(days: int) -> str:
     """
     Use intraday for short/medium windows so hover shows timestamps:
       ≤ 2 days  -> 5m
       ≤ 10 days -> 30m
       ≤ 60 days -> 60m
-      else      -> 1d
+      ≤ 3 years -> 1d
+      ≤ 10 years -> 1w
+      else      -> 1mo
     """
     if days <= 2:  return "5m"
     if days <= 10: return "30m"
     if days <= 60: return "60m"
-    return "1d"
+    if days <= 3 * 365: return "1d"
+    if days <= 10 * 365: return "1w"
+    return "1mo"
+
+# ------------------------------------------------------------
+# Exchange calendar (NYSE/NASDAQ regular sessions)
+# ------------------------------------------------------------
+# Exchange-local wall time, which is what Yahoo bars are stamped in
+MARKET_TZ = ZoneInfo("America/New_York")
+MARKET_OPEN = dt.time(9, 30)
+MARKET_CLOSE = dt.time(16, 0)
+EARLY_CLOSE = dt.time(13, 0)
+INTERVAL_SECONDS = {"5m": 300, "30m": 1800, "60m": 3600, "1d": 86400}
+
+# One-off closures outside the regular holiday rules
+SPECIAL_CLOSURES = {
+    dt.date(2001, 9, 11), dt.date(2001, 9, 12), dt.date(2001, 9, 13), dt.date(2001, 9, 14),
+    dt.date(2004, 6, 11),   # President Reagan
+    dt.date(2007, 1, 2),    # President Ford
+    dt.date(2012, 10, 29), dt.date(2012, 10, 30),  # Hurricane Sandy
+    dt.date(2018, 12, 5),   # President G.H.W. Bush
+    dt.date(2025, 1, 9),    # President Carter
+}
+
+def _easter(year: int) -> dt.date:
+    """Gregorian Easter Sunday (anonymous Gregorian algorithm)."""
+    a, b, c = year % 19, year // 100, year % 100
+    d, e = divmod(b, 4)
+    g = (8 * b + 13) // 25
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = divmod(c, 4)
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    month, day = divmod(h + l - 7 * m + 114, 31)
+    return dt.date(year, month, day + 1)
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> dt.date:
+    """n-th `weekday` (Mon=0) of the month; n=-1 for the last one."""
+    if n > 0:
+        first = dt.date(year, month, 1)
+        return first + dt.timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = dt.date(year + month // 12, month % 12 + 1, 1) - dt.timedelta(days=1)
+    return last - dt.timedelta(days=(last.weekday() - weekday) % 7)
+
+def _observed(day: dt.date) -> dt.date:
+    """Saturday holidays are observed Friday, Sunday ones Monday."""
+    if day.weekday() == 5:
+        return day - dt.timedelta(days=1)
+    if day.weekday() == 6:
+        return day + dt.timedelta(days=1)
+    return day
+
+def nyse_holidays(year: int) -> set[dt.date]:
+    """Full-day NYSE closures in `year` under the current holiday rules."""
+    days = {
+        _nth_weekday(year, 2, 0, 3),            # Washington's Birthday
+        _easter(year) - dt.timedelta(days=2),   # Good Friday
+        _nth_weekday(year, 5, 0, -1),           # Memorial Day
+        _observed(dt.date(year, 7, 4)),         # Independence Day
+        _nth_weekday(year, 9, 0, 1),            # Labor Day
+        _nth_weekday(year, 11, 3, 4),           # Thanksgiving
+        _observed(dt.date(year, 12, 25)),       # Christmas
+    }
+    new_year = dt.date(year, 1, 1)
+    if new_year.weekday() != 5:  # a Saturday New Year is not moved back into December
+        days.add(_observed(new_year))
+    if year >= 1998:
+        days.add(_nth_weekday(year, 1, 0, 3))   # Martin Luther King Jr. Day
+    if year >= 2022:
+        days.add(_observed(dt.date(year, 6, 19)))  # Juneteenth
+    return days | {d for d in SPECIAL_CLOSURES if d.year == year}
+
+def nyse_early_closes(year: int, holidays: set[dt.date]) -> set[dt.date]:
+    """13:00 closes: July 3rd, the day after Thanksgiving and Christmas Eve, when they trade."""
+    candidates = {
+        dt.date(year, 7, 3),
+        _nth_weekday(year, 11, 3, 4) + dt.timedelta(days=1),
+        dt.date(year, 12, 24),
+    }
+    return {d for d in candidates if d.weekday() < 5 and d not in holidays}
+
+CALENDAR_START = dt.date(1990, 1, 1)
+CALENDAR_END = dt.date(dt.date.today().year + 2, 12, 31)
+
+def _build_calendar() -> tuple[np.ndarray, np.ndarray]:
+    """Day-indexed session and early-close bitmaps over [CALENDAR_START, CALENDAR_END]."""
+    days = pd.date_range(CALENDAR_START, CALENDAR_END, freq="D")
+    closed, early = set(), set()
+    for year in range(CALENDAR_START.year, CALENDAR_END.year + 1):
+        holidays = nyse_holidays(year)
+        closed |= holidays
+        early |= nyse_early_closes(year, holidays)
+    sessions = np.asarray(days.dayofweek < 5) & ~days.isin(pd.DatetimeIndex(sorted(closed)))
+    return sessions, days.isin(pd.DatetimeIndex(sorted(early)))
+
+SESSION_BITMAP, EARLY_CLOSE_BITMAP = _build_calendar()
+
+def _day_offset(day: dt.date) -> int:
+    return (day - CALENDAR_START).days
+
+def is_session(day: dt.date) -> bool:
+    """True if the exchange holds a regular session on `day` (weekday rule outside the table)."""
+    i = _day_offset(day)
+    if 0 <= i < len(SESSION_BITMAP):
+        return bool(SESSION_BITMAP[i])
+    return day.weekday() < 5
+
+def session_close(day: dt.date) -> dt.time:
+    i = _day_offset(day)
+    return EARLY_CLOSE if 0 <= i < len(EARLY_CLOSE_BITMAP) and EARLY_CLOSE_BITMAP[i] else MARKET_CLOSE
+
+def get_last_trading_day(date: dt.date) -> dt.date:
+    """Return the most recent session on or before `date` (weekends and exchange holidays skipped)."""
+    while not is_session(date):
+        date -= dt.timedelta(days=1)
+    return date
+
+def next_trading_day(date: dt.date) -> dt.date:
+    """First session strictly after `date`."""
+    date += dt.timedelta(days=1)
+    while not is_session(date):
+        date += dt.timedelta(days=1)
+    return date
 
-def fetch_history(ticker: str, start: dt.date, end: dt.date) -> pd.Series:
+def trim_to_sessions(start: dt.date, end: dt.date) -> tuple[dt.date, dt.date] | None:
+    """Narrow [start, end] to its first and last session, or None if nothing trades in it."""
+    i, j = _day_offset(start), _day_offset(end)
+    if i < 0 or j >= len(SESSION_BITMAP):
+        first = start if is_session(start) else next_trading_day(start)
+        last = get_last_trading_day(end)
+        return (first, last) if first <= last else None
+    hits = np.flatnonzero(SESSION_BITMAP[i:j + 1])
+    if not len(hits):
+        return None
+    return start + dt.timedelta(days=int(hits[0])), start + dt.timedelta(days=int(hits[-1]))
+
+def market_now() -> dt.datetime:
+    """Current exchange-local time as a naive datetime."""
+    return dt.datetime.now(MARKET_TZ).replace(tzinfo=None)
+
+def is_market_open(now: dt.datetime) -> bool:
+    """True during a regular session (holidays closed, early closes honored)."""
+    return is_session(now.date()) and MARKET_OPEN <= now.time() < session_close(now.date())
+
+def next_market_open(now: dt.datetime) -> dt.datetime:
+    """Start of the next regular session strictly after `now`."""
+    day = now.date()
+    if now.time() >= MARKET_OPEN or not is_session(day):
+        day = next_trading_day(day)
+    return dt.datetime.combine(day, MARKET_OPEN)
+
+def history_ttl(interval: str, now: dt.datetime | None = None) -> float:
     """
-    Fetch Close series with a sensible interval.
-    Robust to weekends/holidays and Yahoo intraday quirks by:
-      - Using start/end where possible
-      - Falling back to period-based pulls
-      - For intraday 1D, selecting the last available trading session
-    Returns tz-naive DatetimeIndex (minute-floor for intraday).
+    Seconds a fetched series stays fresh:
+      market open, intraday -> one bar length (capped at the close)
+      market open, daily    -> until today's close
+      market closed         -> until the next open
     """
-    import sys
-    days = (end - start).days or 1
-    interval = pick_interval(days)
+    now = now or market_now()
+    if not is_market_open(now):
+        return (next_market_open(now) - now).total_seconds()
+    until_close = (dt.datetime.combine(now.date(), session_close(now.date())) - now).total_seconds()
+    if interval in ("1d", "1w", "1mo"):
+        return until_close
+    return min(INTERVAL_SECONDS.get(interval, 300), until_close)
 
-    def to_close_series(df: pd.DataFrame) -> pd.Series:
-        if df is None or len(df) == 0:
-            return pd.Series(dtype="float64")
-        if isinstance(df.columns, pd.MultiIndex):
-            cols = [c for c in df.columns if isinstance(c, tuple) and c[0] == "Close"]
-            s = df[cols[0]] if cols else df.get("Close", pd.Series(dtype="float64"))
-        else:
-            s = df.get("Close", pd.Series(dtype="float64"))
-        if isinstance(s, pd.DataFrame):
-            s = s.squeeze("columns")
-        s = s.dropna().copy()
-        if s.empty:
-            return s
-        s.index = pd.to_datetime(s.index).tz_localize(None)
-        if interval == "1d":
-            s.index = s.index.normalize()
+OHLCV_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+def to_ohlcv_frame(df: pd.DataFrame, interval: str, ticker: str | None = None) -> pd.DataFrame:
+    """
+    Normalize a yfinance download/history frame to float OHLCV columns on a
+    sorted, de-duplicated tz-naive DatetimeIndex (day-normalized for 1d,
+    minute-floor for intraday). `ticker` picks one symbol out of a
+    multi-ticker download; otherwise the first symbol is used.
+    """
+    empty = pd.DataFrame(columns=OHLCV_COLUMNS, dtype="float64", index=pd.DatetimeIndex([], name="Date"))
+    if df is None or len(df) == 0:
+        return empty
+    if isinstance(df.columns, pd.MultiIndex):
+        if ticker is not None:
+            # multi-ticker download: ("Close", "AAPL"), ("Close", "MSFT"), ...
+            if ticker not in df.columns.get_level_values(1):
+                return empty
+            df = df.xs(ticker, axis=1, level=1)
         else:
-            s.index = s.index.floor("min")
-        s.name = "Close"
-        return s
+            # single-ticker download: ("Close", "AAPL") -> "Close"
+            fields = df.columns.get_level_values(0)
+            df = df.loc[:, ~fields.duplicated()]
+            df.columns = df.columns.get_level_values(0)
+    out = df.reindex(columns=OHLCV_COLUMNS).astype("float64")
+    out.columns.name = None
+    out = out[out["Close"].notna()].copy()
+    out.index = pd.to_datetime(out.index)
+    if out.index.tz is not None:
+        out.index = out.index.tz_localize(None)
+    if interval == "1d":
+        out.index = out.index.normalize()
+    else:
+        out.index = out.index.floor("min")
+    out.index.name = "Date"
+    out = out[~out.index.duplicated(keep="last")].sort_index()
+    return out
 
-    # --- Fast path: intraday 1D -> pull last available session explicitly ---
-    if interval != "1d" and days == 1:
+def to_close_series(df: pd.DataFrame, interval: str, ticker: str | None = None) -> pd.Series:
+    """Close column of `to_ohlcv_frame`, named "Close"."""
+    s = to_ohlcv_frame(df, interval, ticker)["Close"].copy()
+    s.name = "Close"
+    return s
+
+# ------------------------------------------------------------
+# Upstream fetch strategies + hedged executor
+# ------------------------------------------------------------
+# Each strategy returns normalized OHLCV bars for [start, end] (empty when it
+# has nothing or does not apply) and raises on upstream errors. Strategies in
+# PARTIAL_STRATEGIES may return only part of the window.
+class UpstreamError(Exception):
+    """yf.download came back empty and logged an upstream failure (it never raises)."""
+
+# yfinance errors that mean "no data for this symbol/window", not an outage
+_MISSING_DATA_ERRORS = ("YFTickerMissingError", "YFTzMissingError", "YFPricesMissingError", "possibly delisted")
+# logged when the timezone lookup itself fails; yfinance then reports the
+# symbol as "possibly delisted; no timezone found" although nothing answered
+_TZ_FETCH_FAILED = re.compile(r"Failed to get ticker '([^']+)' reason:")
+
+class _YFErrorLog(logging.Handler):
+    """
+    Error lines the yfinance logger emits for one call: everything on the
+    calling thread, plus failed timezone lookups for `symbols` from the
+    download threads of a threaded batch.
+    """
+
+    def __init__(self, symbols: list[str]):
+        super().__init__(logging.ERROR)
+        self.thread = threading.get_ident()
+        self.symbols = {sym.upper() for sym in symbols}
+        self.lines: list[str] = []
+
+    def emit(self, record: logging.LogRecord) -> None:
+        msg = record.getMessage()
+        tz_failed = _TZ_FETCH_FAILED.match(msg)
+        if record.thread == self.thread or (tz_failed and tz_failed.group(1).upper() in self.symbols):
+            self.lines.append(msg)
+
+    def upstream_failures(self) -> list[str]:
+        """Lines that point at the network/Yahoo rather than at missing data."""
+        return [line for line in self.lines
+                if _TZ_FETCH_FAILED.match(line)
+                or (line.startswith("[") and not any(m in line for m in _MISSING_DATA_ERRORS))]
+
+@contextmanager
+def _yf_error_log(symbols: list[str]):
+    log = _YFErrorLog(symbols)
+    logger = logging.getLogger("yfinance")
+    logger.addHandler(log)
+    try:
+        yield log
+    finally:
+        logger.removeHandler(log)
+
+def _yf_download(tickers, **kwargs) -> pd.DataFrame:
+    """
+    yf.download that raises UpstreamError when it returns nothing because of
+    an upstream failure. yfinance catches every per-ticker exception and only
+    logs it ("['AAPL']: ConnectionError(...)"), so an outage would otherwise
+    look exactly like a window with no data.
+    """
+    with _yf_error_log(tickers.split() if isinstance(tickers, str) else list(tickers)) as log:
+        d = yf.download(tickers, **kwargs)
+    if d is None or d.empty:
+        if failures := log.upstream_failures():
+            raise UpstreamError("; ".join(failures))
+    return d
+
+def _last_session(f: pd.DataFrame) -> pd.DataFrame:
+    """Bars of the most recent date that has any."""
+    if f.empty:
+        return f
+    last_session = f.index.normalize().max()
+    return f[f.index.normalize() == last_session]
+
+def _pull_session(ticker: str, start: dt.date, end: dt.date, interval: str) -> pd.DataFrame:
+    """Intraday 1D chart: pull the last available session explicitly (offered only with `session=True`)."""
+    if interval == "1d":
+        return to_ohlcv_frame(None, interval)
+    d0 = _yf_download(
+        ticker, period="5d", interval=interval,
+        progress=False, auto_adjust=False, threads=False,
+    )
+    return _last_session(to_ohlcv_frame(d0, interval))
+
+def _pull_download(ticker: str, start: dt.date, end: dt.date, interval: str) -> pd.DataFrame:
+    """Straightforward start/end download (yfinance 'end' is exclusive; widen by a day)."""
+    d = _yf_download(
+        ticker, start=start, end=end + dt.timedelta(days=1),
+        interval=interval, progress=False, auto_adjust=False, threads=False,
+    )
+    return to_ohlcv_frame(d, interval)
+
+def _pull_history(ticker: str, start: dt.date, end: dt.date, interval: str) -> pd.DataFrame:
+    """Retry through Ticker.history(start/end)."""
+    with _yf_error_log([ticker]) as log:
         try:
-            d0 = yf.download(
-                ticker, period="5d", interval=interval,
-                progress=False, auto_adjust=False, threads=False,
+            h = yf.Ticker(ticker).history(
+                start=start, end=end + dt.timedelta(days=1), interval=interval, auto_adjust=False,
+                raise_errors=True,
             )
-            s0 = to_close_series(d0)
-            if not s0.empty:
-                # choose the most recent date that has bars
-                last_session = s0.index.normalize().max()
-                s0 = s0[s0.index.normalize() == last_session]
-                if not s0.empty:
-                    return s0
-        except Exception as e:
-            print(f"[fetch_history] 1D intraday session pull error: {e}", file=sys.stderr)
+        except YFTickerMissingError as e:
+            if failures := log.upstream_failures():
+                raise UpstreamError("; ".join(failures)) from e
+            raise
+    return to_ohlcv_frame(h, interval)
 
-    # yfinance uses exclusive 'end'; widen by a day for safety
-    end_inclusive = end + dt.timedelta(days=1)
+def _pull_period(ticker: str, start: dt.date, end: dt.date, interval: str) -> pd.DataFrame:
+    """Intraday fallback: period pull, then slice (1D still picks the last session)."""
+    if interval == "1d":
+        return to_ohlcv_frame(None, interval)
+    days = (end - start).days or 1
+    d2 = _yf_download(
+        ticker, period="7d" if days <= 7 else "30d", interval=interval,
+        progress=False, auto_adjust=False, threads=False,
+    )
+    f2 = to_ohlcv_frame(d2, interval)
+    if days == 1:
+        return _last_session(f2)
+    # slice calendar window for multi-day intraday
+    mask = (f2.index >= pd.Timestamp(start)) & (f2.index < pd.Timestamp(end + dt.timedelta(days=1)))
+    return f2.loc[mask]
+
+FETCH_STRATEGIES = {
+    "1D intraday session pull": _pull_session,
+    "download": _pull_download,
+    "history": _pull_history,
+    "intraday period fallback": _pull_period,
+}
+# Period/session pulls return a recent slice, not [start, end]: they only run
+# once every full-window strategy has failed or come back empty, and their
+# bars vouch only for the sessions they hold (see _returned_sessions).
+PARTIAL_STRATEGIES = frozenset({"1D intraday session pull", "intraday period fallback"})
+# Strategies that are no-ops for daily bars; the session pull also needs a 1D chart.
+INTRADAY_STRATEGIES = frozenset({"1D intraday session pull", "intraday period fallback"})
+
+def _strategy_applies(name: str, interval: str, session: bool) -> bool:
+    if name in INTRADAY_STRATEGIES and interval == "1d":
+        return False
+    return session or name != "1D intraday session pull"
+# Start the next strategy if the running ones have not produced bars after this many
+# seconds; give up entirely after FETCH_DEADLINE (the chart then shows "no data").
+FETCH_HEDGE_DELAY = float(os.environ.get("FETCH_HEDGE_DELAY", 1.5))
+FETCH_DEADLINE = float(os.environ.get("FETCH_DEADLINE", 12))
+FETCH_WORKERS = int(os.environ.get("FETCH_WORKERS", 32))  # room for every request thread plus its hedges
+_fetch_pool_state: dict = {}
+
+def fetch_pool() -> ThreadPoolExecutor:
+    """Shared upstream I/O pool, recreated in forked children (pool threads do not survive fork)."""
+    if _fetch_pool_state.get("pid") != os.getpid():
+        _fetch_pool_state.update(pid=os.getpid(), pool=ThreadPoolExecutor(FETCH_WORKERS, thread_name_prefix="fetch"))
+    return _fetch_pool_state["pool"]
 
-    # --- 1) Try straightforward start/end ---
+STRATEGY_SKIP_AFTER = int(os.environ.get("STRATEGY_SKIP_AFTER", 4))
+STRATEGY_RETRY_AFTER = float(os.environ.get("STRATEGY_RETRY_AFTER", 600))
+
+class StrategyStats:
+    """
+    Per (interval, window class, strategy) success rate and latency, as
+    exponentially weighted averages, used to order FETCH_STRATEGIES. A
+    strategy failing STRATEGY_SKIP_AFTER times in a row is skipped until
+    STRATEGY_RETRY_AFTER seconds have passed, then probed again.
+    """
+
+    ALPHA = 0.3
+
+    def __init__(self):
+        self._stats: dict = {}  # key -> dict(success, latency, failures, last_try)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def window_class(interval: str, start: dt.date, end: dt.date) -> tuple[str, str]:
+        days = (end - start).days or 1
+        return interval, "1d" if days <= 1 else "week" if days <= 10 else "quarter" if days <= 90 else "long"
+
+    def record(self, cls: tuple[str, str], name: str, ok: bool, latency: float) -> None:
+        with self._lock:
+            s = self._stats.setdefault((cls, name), dict(success=0.5, latency=FETCH_HEDGE_DELAY, failures=0, last_try=0.0))
+            s["success"] += self.ALPHA * ((1.0 if ok else 0.0) - s["success"])
+            if ok:
+                s["latency"] += self.ALPHA * (latency - s["latency"])
+            s["failures"] = 0 if ok else s["failures"] + 1
+            s["last_try"] = time.monotonic()
+
+    def ordered(self, cls: tuple[str, str], session: bool = False) -> list[tuple[str, object]]:
+        """
+        Strategies that apply to this window class (see _strategy_applies),
+        by expected time-to-data (latency / success rate), dead ones dropped.
+        Full-window strategies always come before PARTIAL_STRATEGIES: a fast
+        period pull returns less data, not the same data sooner, so stats
+        only reorder within each group. Skipping never removes every
+        full-window strategy: the one tried longest ago keeps being probed,
+        so a window is never left with nothing to ask upstream.
+        """
+        now = time.monotonic()
+        applicable = [(name, fn) for name, fn in FETCH_STRATEGIES.items() if _strategy_applies(name, cls[0], session)]
+        ranked, skipped = [], []
+        with self._lock:
+            for i, (name, fn) in enumerate(applicable):
+                partial = name in PARTIAL_STRATEGIES
+                s = self._stats.get((cls, name))
+                if s is None:
+                    ranked.append((partial, FETCH_HEDGE_DELAY / 0.5, i, name, fn))
+                    continue
+                if s["failures"] >= STRATEGY_SKIP_AFTER and now - s["last_try"] < STRATEGY_RETRY_AFTER:
+                    if not partial:
+                        skipped.append((s["last_try"], i, name, fn))
+                    continue
+                ranked.append((partial, s["latency"] / max(s["success"], 0.05), i, name, fn))
+        if skipped and all(partial for partial, *_ in ranked):
+            _, i, name, fn = min(skipped)
+            ranked.append((False, 0.0, i, name, fn))
+        if not ranked:
+            return applicable
+        return [(name, fn) for _, _, _, name, fn in sorted(ranked)]
+
+strategy_stats = StrategyStats()
+
+class CircuitBreaker:
+    """
+    Consecutive-error breaker for one upstream. After `threshold` upstream
+    errors in a row it opens and calls fail fast for `cooldown` seconds;
+    then one probe call is let through (half-open), and its outcome closes
+    the breaker or opens it for another cooldown.
+    """
+
+    def __init__(self, name: str, threshold: int, cooldown: float):
+        self.name, self.threshold, self.cooldown = name, threshold, cooldown
+        self.failures = 0
+        self.opened_at: float | None = None
+        self._probe_thread: int | None = None  # thread running the half-open probe
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._probe_thread is not None or time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            self._probe_thread = threading.get_ident()
+            return True
+
+    def retry_in(self) -> float:
+        """Seconds until the next probe is allowed (0 when closed)."""
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.cooldown - (time.monotonic() - self.opened_at))
+
+    def release(self) -> None:
+        """End this thread's half-open probe if it recorded nothing (e.g. no data for that symbol)."""
+        with self._lock:
+            if self._probe_thread == threading.get_ident():
+                self._probe_thread = None
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            self._probe_thread = None
+            if ok:
+                self.failures, self.opened_at = 0, None
+                return
+            self.failures += 1
+            if self.failures >= self.threshold:
+                if self.opened_at is None:
+                    print(f"[fetch_history] {self.name} circuit open after {self.failures} errors", file=sys.stderr)
+                self.opened_at = time.monotonic()
+
+# Missing data for a symbol/window is not an upstream fault; everything else
+# raised by a strategy (network, rate limit, 5xx) counts toward the breaker.
+yahoo_breaker = CircuitBreaker(
+    "yahoo",
+    threshold=int(os.environ.get("BREAKER_THRESHOLD", 5)),
+    cooldown=float(os.environ.get("BREAKER_COOLDOWN", 30)),
+)
+
+def _is_upstream_error(e: BaseException | None) -> bool:
+    return e is not None and not isinstance(e, YFTickerMissingError)
+
+def _stats_recorder(cls: tuple[str, str], name: str, started: float):
+    def record(fut) -> None:
+        if fut.cancelled():
+            return
+        e = fut.exception()
+        ok = e is None and not fut.result().empty
+        strategy_stats.record(cls, name, ok, time.monotonic() - started)
+        if ok or _is_upstream_error(e):
+            yahoo_breaker.record(ok)
+    return record
+
+def _download_window(ticker: str, start: dt.date, end: dt.date, interval: str,
+                     session: bool = False) -> tuple[pd.DataFrame, bool]:
+    """
+    Network fetch of OHLCV bars for [start, end] at `interval`, hedged across
+    FETCH_STRATEGIES in the order `strategy_stats` has learned works best for
+    this kind of window: the next strategy starts as soon as the running ones
+    have all come back empty/failed, or after FETCH_HEDGE_DELAY if they are
+    merely slow. The first non-empty result wins; strategies not yet started
+    are cancelled and late results are dropped. Worst-case latency is
+    bounded by FETCH_DEADLINE.
+
+    PARTIAL_STRATEGIES are held back until every full-window strategy has
+    failed or come back empty; the session pull is only offered when
+    `session` says the chart is a 1D view. Returns (bars, complete), where
+    complete is False when the bars came from a partial pull.
+
+    Empty bars are returned only when upstream answered that it has none.
+    If no bars came back and any strategy failed upstream, ran past the
+    deadline or was never tried because the circuit breaker is open (or no
+    strategy was left to try), this raises UpstreamError instead.
+    """
+    if not yahoo_breaker.allow():
+        raise UpstreamError(f"circuit open, retry in {yahoo_breaker.retry_in():.0f}s")
+    cls = StrategyStats.window_class(interval, start, end)
+    ordered = strategy_stats.ordered(cls, session)
+    pending = [(name, fn) for name, fn in ordered if name not in PARTIAL_STRATEGIES]
+    fallback = [(name, fn) for name, fn in ordered if name in PARTIAL_STRATEGIES]
+    running: dict = {}
+    failed = None if ordered else "no fetch strategy left to try"
+    deadline = time.monotonic() + FETCH_DEADLINE
+    pool = fetch_pool()
     try:
-        d = yf.download(
+        while pending or running or fallback:
+            if not pending and not running:
+                pending, fallback = fallback, []  # every full-window pull failed or was empty
+            if pending and yahoo_breaker.retry_in():
+                pending.clear()  # breaker opened mid-chain: stop feeding it
+                fallback.clear()
+                failed = failed or "circuit opened"
+            if pending and (not running or time.monotonic() >= hedge_at):
+                name, fn = pending.pop(0)
+                fut = pool.submit(fn, ticker, start, end, interval)
+                # late finishers still count toward the stats
+                fut.add_done_callback(_stats_recorder(cls, name, time.monotonic()))
+                running[fut] = name
+                hedge_at = time.monotonic() + FETCH_HEDGE_DELAY
+            timeout = min(hedge_at if pending else deadline, deadline) - time.monotonic()
+            if timeout <= 0 and not pending:
+                print(f"[fetch_history] deadline exceeded for {ticker} {start}→{end}", file=sys.stderr)
+                failed = "deadline exceeded"
+                break
+            done, _ = wait(running, timeout=max(timeout, 0), return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = running.pop(fut)
+                try:
+                    f = fut.result()
+                except Exception as e:
+                    print(f"[fetch_history] {name} error: {e}", file=sys.stderr)
+                    if _is_upstream_error(e):
+                        failed = f"{name}: {e}"
+                    continue
+                if not f.empty:
+                    return f, name not in PARTIAL_STRATEGIES
+    finally:
+        for fut in running:
+            fut.cancel()
+        yahoo_breaker.release()
+    if failed:
+        raise UpstreamError(failed)
+    return to_ohlcv_frame(None, interval), True
+
+# ------------------------------------------------------------
+# On-disk history cache (Parquet, one file per ticker + interval)
+# ------------------------------------------------------------
+HISTORY_CACHE_DIR = Path(os.environ.get(
+    "HISTORY_CACHE_DIR", Path(__file__).resolve().parent.parent / ".cache" / "history"
+))
+_history_locks: dict[tuple[str, str], threading.Lock] = {}
+_history_locks_guard = threading.Lock()
+
+@contextmanager
+def _history_lock(ticker: str, interval: str):
+    """
+    Exclusive access to one (ticker, interval) cache file: a thread lock
+    within the process plus an flock across worker processes, so a worker
+    that waits behind another's download finds the cache already filled.
+    """
+    with _history_locks_guard:
+        lock = _history_locks.setdefault((ticker, interval), threading.Lock())
+    with lock:
+        if fcntl is None:
+            yield
+            return
+        path = _cache_path(ticker, interval, HISTORY_CACHE_DIR / "locks").with_suffix(".lock")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+def _cache_path(ticker: str, interval: str, root: Path = HISTORY_CACHE_DIR) -> Path:
+    safe = "".join(c if c.isalnum() or c in "-._" else "_" for c in ticker.upper())
+    return root / f"{safe}_{interval}.parquet"
+
+def load_cached_frame(ticker: str, interval: str, root: Path = HISTORY_CACHE_DIR) -> pd.DataFrame:
+    """
+    Read the cached OHLCV frame for (ticker, interval). The covered calendar
+    range lives in `frame.attrs["coverage"]` as [start_iso, end_iso]; an
+    unreadable or missing file yields an empty frame with no coverage.
+    """
+    path = _cache_path(ticker, interval, root)
+    try:
+        return pd.read_parquet(path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"[history_cache] unreadable {path.name}: {e}", file=sys.stderr)
+    return to_ohlcv_frame(None, interval)
+
+def store_cached_frame(ticker: str, interval: str, frame: pd.DataFrame, root: Path = HISTORY_CACHE_DIR) -> None:
+    """Atomically replace the cached file (write temp + rename), so concurrent readers never see a partial file."""
+    path = _cache_path(ticker, interval, root)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        frame.to_parquet(tmp)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"[history_cache] write error {path.name}: {e}", file=sys.stderr)
+
+def _missing_ranges(coverage, start: dt.date, end: dt.date) -> list[tuple[dt.date, dt.date]]:
+    """Calendar sub-ranges of [start, end] that fall outside the cached coverage."""
+    if not coverage:
+        return [(start, end)]
+    cov_start, cov_end = (dt.date.fromisoformat(d) for d in coverage)
+    if end < cov_start or start > cov_end + dt.timedelta(days=1):
+        # disjoint: fetch the bridge too so coverage stays one contiguous range
+        return [(min(start, cov_start), max(end, cov_end))]
+    gaps = []
+    if start < cov_start:
+        gaps.append((start, cov_start - dt.timedelta(days=1)))
+    if end > cov_end:
+        gaps.append((cov_end + dt.timedelta(days=1), end))
+    return gaps
+
+def _download_tail(ticker: str, since: pd.Timestamp, end: dt.date, interval: str) -> pd.DataFrame:
+    """
+    Incremental pull of the bars from `since` (the last cached bar, inclusive
+    so a still-forming bar gets replaced) through `end`. Cost scales with the
+    number of new bars, not with the chart window. Raises UpstreamError
+    when it gets nothing because upstream failed (see _download_window).
+    """
+    end_inclusive = end + dt.timedelta(days=1)
+    # daily bars are keyed by date; intraday accepts an exchange-local datetime
+    start = since.date() if interval == "1d" else since.to_pydatetime()
+    if not yahoo_breaker.allow():
+        raise UpstreamError(f"circuit open, retry in {yahoo_breaker.retry_in():.0f}s")
+    try:
+        d = _yf_download(
             ticker, start=start, end=end_inclusive,
             interval=interval, progress=False, auto_adjust=False, threads=False,
         )
-        s = to_close_series(d)
+        f = to_ohlcv_frame(d, interval)
+        if not f.empty:
+            yahoo_breaker.record(True)
+        return f.loc[f.index >= since]
+    except Exception as e:
+        print(f"[fetch_history] tail refresh error: {e}", file=sys.stderr)
+        yahoo_breaker.record(not _is_upstream_error(e))
+    finally:
+        yahoo_breaker.release()
+    fresh, complete = _download_window(ticker, since.date(), end, interval)
+    if not complete:
+        # a period pull that starts after `since` would leave a hole behind the cached bars
+        span = _returned_sessions(fresh, since.date(), end)
+        if span is None or not _adjoins(span, since.date(), since.date()):
+            return to_ohlcv_frame(None, interval)
+    return fresh
+
+def _merge_bars(frame: pd.DataFrame, fresh: pd.DataFrame) -> pd.DataFrame:
+    """Append fresh bars, newer rows winning on duplicate timestamps."""
+    if not len(frame):
+        return fresh
+    merged = pd.concat([frame, fresh])
+    return merged[~merged.index.duplicated(keep="last")].sort_index()
+
+def _returned_sessions(fresh: pd.DataFrame, start: dt.date, end: dt.date) -> tuple[dt.date, dt.date] | None:
+    """
+    Sessions of [start, end] a partial-window pull holds in full: from the
+    day of its first bar (the next session if that bar is after the open,
+    as a period pull starts mid-session) through the day of its last bar.
+    """
+    first, last = fresh.index.min(), fresh.index.max()
+    d0 = first.date() if first.time() <= MARKET_OPEN else next_trading_day(first.date())
+    d0, d1 = max(start, d0), min(end, last.date())
+    return (d0, d1) if d0 <= d1 else None
+
+def _adjoins(span: tuple[dt.date, dt.date], lo: dt.date | None, hi: dt.date | None) -> bool:
+    """True if `span` overlaps or touches coverage [lo, hi] with no session between (or there is none yet)."""
+    if lo is None:
+        return True
+    d0, d1 = span
+    day = dt.timedelta(days=1)
+    if d0 > hi:
+        return trim_to_sessions(hi + day, d0 - day) is None
+    if d1 < lo:
+        return trim_to_sessions(d1 + day, lo - day) is None
+    return True
+
+def _plan_fetch(frame: pd.DataFrame, start: dt.date, end: dt.date, refresh: bool,
+                now: dt.datetime) -> tuple[list[tuple[dt.date, dt.date]], pd.Timestamp | None]:
+    """
+    What a cached frame still needs for [start, end]: gaps to download,
+    trimmed to exchange sessions, plus the timestamp to pull the tail from
+    (None if the tail is still fresh or there is no coverage yet to extend).
+    """
+    coverage = frame.attrs.get("coverage")
+    gaps = _missing_ranges(coverage, start, end)
+    tail_since = None
+    if coverage and len(frame):
+        last_bar = frame.index.max()
+        cov_end = dt.date.fromisoformat(coverage[1])
+        if gaps and gaps[-1][0] == cov_end + dt.timedelta(days=1):
+            gaps.pop()
+            fresh_until = frame.attrs.get("tail_fresh_until")
+            if refresh or not fresh_until or now >= dt.datetime.fromisoformat(fresh_until):
+                tail_since = last_bar
+        elif refresh and end >= last_bar.date():
+            tail_since = last_bar
+    # only ask upstream for sessions that exist; gaps of weekends/holidays cost nothing
+    gaps = [g for g in (trim_to_sessions(g0, g1) for g0, g1 in gaps) if g]
+    return gaps, tail_since
+
+def _save_history(ticker: str, interval: str, frame: pd.DataFrame, lo: dt.date | None,
+                  hi: dt.date | None, end: dt.date, now: dt.datetime) -> None:
+    """Record coverage/tail freshness on `frame`, persist it and refresh its pyramid levels."""
+    settled = now.date() - dt.timedelta(days=1)
+    if end > settled:
+        frame.attrs["tail_fresh_until"] = (now + dt.timedelta(seconds=history_ttl(interval, now))).isoformat()
+    if lo is not None and hi is not None and hi >= lo:
+        frame.attrs["coverage"] = [lo.isoformat(), hi.isoformat()]
+    else:
+        frame.attrs.pop("coverage", None)
+    store_cached_frame(ticker, interval, frame)
+    update_pyramid(ticker, interval, frame)
+
+def cached_history(ticker: str, start: dt.date, end: dt.date, interval: str,
+                   refresh: bool = False, session: bool = False) -> tuple[pd.DataFrame, bool]:
+    """
+    Cached OHLCV frame for (ticker, interval) covering at least [start, end]
+    where upstream has data. Only the calendar gaps outside the cached
+    coverage go to the network. Coverage is never extended past yesterday
+    (exchange-local), so the current, possibly still trading, session is
+    always re-fetched.
+
+    The gap after the cached coverage is filled incrementally: only bars from
+    the last cached timestamp onward are pulled and merged in, and not again
+    until `history_ttl` has passed (`frame.attrs["tail_fresh_until"]`), so
+    switching between windows served by the same file stays offline.
+    `refresh=True` (the "Update Chart" button) forces that tail pull even
+    when the coverage already reaches `end`. `session=True` (a 1D chart) lets
+    the gap ending at `end` fall back to a last-session pull.
+
+    Coverage grows by the whole gap only for full-window downloads; bars
+    from a partial pull extend it just over the sessions they hold, and only
+    where that keeps it one contiguous range.
+
+    Returns (frame, clean); clean is False when a download failed upstream
+    (error, deadline, open breaker), so missing bars may not really be missing.
+    """
+    now = market_now()
+    settled = now.date() - dt.timedelta(days=1)  # exchange-local: the host's date may already be tomorrow
+    with _history_lock(ticker, interval):
+        frame = load_cached_frame(ticker, interval)
+        coverage = frame.attrs.get("coverage")
+        gaps, tail_since = _plan_fetch(frame, start, end, refresh, now)
+        if not gaps and tail_since is None:
+            return frame, True
+
+        lo, hi = (dt.date.fromisoformat(d) for d in coverage) if coverage else (None, None)
+        changed, clean = False, True
+        for g0, g1 in gaps:
+            try:
+                fresh, complete = _download_window(ticker, g0, g1, interval,
+                                                   session=session and (g0, g1) == gaps[-1])
+            except UpstreamError:
+                clean = False
+                continue
+            if fresh.empty:
+                continue
+            frame = _merge_bars(frame, fresh)
+            changed = True
+            if not complete:
+                span = _returned_sessions(fresh, g0, g1)
+                if span is None or not _adjoins(span, lo, hi):
+                    continue
+                g0, g1 = span
+            lo = g0 if lo is None else min(lo, g0)
+            hi = min(g1, settled) if hi is None else max(hi, min(g1, settled))
+
+        if tail_since is not None:
+            try:
+                fresh = _download_tail(ticker, tail_since, end, interval)
+                if not fresh.empty:
+                    frame = _merge_bars(frame, fresh)
+                    hi = max(hi, min(end, settled))
+                changed = True  # the tail is fresh, even if upstream had nothing new
+            except UpstreamError:
+                clean = False
+
+        if changed:
+            _save_history(ticker, interval, frame, lo, hi, end, now)
+        return frame, clean
+
+# ------------------------------------------------------------
+# Batched multi-ticker downloads
+# ------------------------------------------------------------
+def download_batch(tickers: list[str], start: dt.date, end: dt.date, interval: str) -> dict[str, pd.DataFrame]:
+    """
+    One threaded `yf.download` for many tickers over [start, end], split into
+    per-ticker OHLCV frames. Tickers Yahoo returned nothing for map to empty
+    frames; a failed call (or an open circuit breaker) maps every ticker to
+    an empty frame.
+    """
+    d = None
+    if yahoo_breaker.allow():
+        try:
+            d = _yf_download(
+                tickers, start=start, end=end + dt.timedelta(days=1), interval=interval,
+                group_by="column", progress=False, auto_adjust=False, threads=True,
+            )
+            if not d.empty:
+                yahoo_breaker.record(True)
+        except Exception as e:
+            print(f"[fetch_history] batch download error: {e}", file=sys.stderr)
+            yahoo_breaker.record(not _is_upstream_error(e))
+        finally:
+            yahoo_breaker.release()
+    return {t: to_ohlcv_frame(d, interval, ticker=t) for t in tickers}
+
+def warm_history_batch(tickers: list[str], start: dt.date, end: dt.date, interval: str,
+                       refresh: bool = False) -> None:
+    """
+    Bring the (ticker, interval) caches of `tickers` up to [start, end] with
+    a single batch download. Each ticker's own gaps and stale tail decide
+    the batch start; tickers that need nothing are left out of the call.
+    """
+    now = market_now()
+    settled = now.date() - dt.timedelta(days=1)
+    needs = {}
+    for t in tickers:
+        gaps, tail_since = _plan_fetch(load_cached_frame(t, interval), start, end, refresh, now)
+        if gaps or tail_since is not None:
+            needs[t] = min([g0 for g0, _ in gaps] + ([tail_since.date()] if tail_since is not None else []))
+    if not needs:
+        return
+    batch_start = min(needs.values())
+    fresh_by_ticker = download_batch(list(needs), batch_start, end, interval)
+    for t, fresh in fresh_by_ticker.items():
+        if fresh.empty:
+            continue
+        with _history_lock(t, interval):
+            frame = load_cached_frame(t, interval)
+            coverage = frame.attrs.get("coverage")
+            lo, hi = (dt.date.fromisoformat(d) for d in coverage) if coverage else (None, None)
+            if lo is None or batch_start > hi + dt.timedelta(days=1):
+                lo, hi = batch_start, min(end, settled)
+            else:
+                lo, hi = min(lo, batch_start), max(hi, min(end, settled))
+            _save_history(t, interval, _merge_bars(frame, fresh), lo, hi, end, now)
+
+def fetch_history_batch(tickers: list[str], start: dt.date, end: dt.date,
+                        refresh: bool = False) -> dict[str, pd.Series]:
+    """
+    `fetch_history` for many tickers over the same window, with every cache
+    miss served by one batched upstream round trip instead of one per ticker.
+    """
+    days = (end - start).days or 1
+    source, fetch_start = _history_source(pick_interval(days), start, end)
+    warm_history_batch(tickers, fetch_start, end, source, refresh=refresh)
+    return {t: fetch_history(t, start, end) for t in tickers}
+
+# ------------------------------------------------------------
+# Multi-timeframe pyramid (pre-aggregated bars per ticker)
+# ------------------------------------------------------------
+# level -> the level it is aggregated from. 5m and 1d are the downloaded
+# bases; everything else is rebuilt locally whenever a base file changes,
+# so requests for coarser bars are a single file read.
+PYRAMID = {"30m": "5m", "60m": "30m", "1w": "1d", "1mo": "1d"}
+PYRAMID_CACHE_DIR = HISTORY_CACHE_DIR / "pyramid"
+OHLCV_AGG = {"Open": "first", "High": "max", "Low": "min", "Close": "last", "Volume": "sum"}
+
+def resample_bars(frame: pd.DataFrame, interval: str) -> pd.DataFrame:
+    """
+    Aggregate finer OHLCV bars into `interval` bars with one vectorized
+    groupby. Intraday bins are anchored at the session open (09:30,
+    10:00/10:30, ...) like Yahoo's own bars, so an hour never straddles the
+    open; weekly bins start on Monday and monthly bins on the 1st.
+    """
+    if frame.empty:
+        return frame
+    idx = frame.index
+    if interval == "1w":
+        bins = idx.normalize() - pd.to_timedelta(idx.dayofweek, unit="D")
+    elif interval == "1mo":
+        bins = idx.to_period("M").to_timestamp()
+    else:
+        step = pd.Timedelta(seconds=INTERVAL_SECONDS[interval])
+        session_open = pd.Timedelta(hours=MARKET_OPEN.hour, minutes=MARKET_OPEN.minute)
+        day = idx.normalize()
+        bins = day + session_open + ((idx - day - session_open) // step) * step
+    out = frame.groupby(bins).agg(OHLCV_AGG)
+    out.index.name = "Date"
+    return out
+
+def pyramid_base(interval: str) -> str:
+    """Downloaded interval at the bottom of `interval`'s pyramid chain (itself if native)."""
+    while interval in PYRAMID:
+        interval = PYRAMID[interval]
+    return interval
+
+def _base_stamp(base: pd.DataFrame) -> str | None:
+    """Identifies the base bars a level was built from (first bar, last bar, row count)."""
+    if not len(base):
+        return None
+    return f"{base.index.min().isoformat()}/{base.index.max().isoformat()}/{len(base)}"
+
+def _update_level(level: pd.DataFrame, source: pd.DataFrame, interval: str) -> pd.DataFrame:
+    """Re-aggregate only the bins from the last stored (possibly still forming) one onward."""
+    if source.empty:
+        return level
+    if level.empty or source.index.min() < level.index.min():
+        return resample_bars(source, interval)
+    since = level.index.max()
+    tail = resample_bars(source.loc[source.index >= since], interval)
+    return _merge_bars(level.loc[level.index < since], tail)
+
+def update_pyramid(ticker: str, base_interval: str, base: pd.DataFrame) -> dict[str, pd.DataFrame]:
+    """
+    Bring every level built on `base_interval` up to date with `base` and
+    persist the ones that changed. Callers hold the base's history lock.
+    """
+    frames = {base_interval: base}
+    stamp = _base_stamp(base)
+    for interval, parent in PYRAMID.items():
+        if parent not in frames:
+            continue
+        level = load_cached_frame(ticker, interval, PYRAMID_CACHE_DIR)
+        if level.attrs.get("base") != stamp:
+            level = _update_level(level, frames[parent], interval)
+            level.attrs = {"base": stamp}
+            store_cached_frame(ticker, interval, level, PYRAMID_CACHE_DIR)
+        frames[interval] = level
+    return frames
+
+def pyramid_frame(ticker: str, interval: str, base: pd.DataFrame) -> pd.DataFrame:
+    """
+    Stored `interval` bars consistent with `base`; rebuilt only if the level
+    file is missing or older than the base (e.g. a cache dir written before
+    the level existed).
+    """
+    level = load_cached_frame(ticker, interval, PYRAMID_CACHE_DIR)
+    if level.attrs.get("base") == _base_stamp(base):
+        return level
+    with _history_lock(ticker, pyramid_base(interval)):
+        return update_pyramid(ticker, pyramid_base(interval), base)[interval]
+
+def _pyramid_source(interval: str, start: dt.date) -> str | None:
+    """
+    Base interval to serve `interval` from via the pyramid, or None to
+    download it natively (30m/60m windows older than the 5m history limit).
+    """
+    if interval not in PYRAMID:
+        return None
+    base = pyramid_base(interval)
+    if base != "1d" and start < dt.date.today() - dt.timedelta(days=FETCH_SPAN_DAYS[base]):
+        return None
+    return base
+
+def select_window(frame: pd.DataFrame, start: dt.date, end: dt.date, interval: str) -> pd.Series:
+    """
+    Close series for [start, end] out of a cached frame. Intraday 1D windows
+    select the last session with bars on or before `end`.
+    """
+    days = (end - start).days or 1
+    end_inclusive = pd.Timestamp(end + dt.timedelta(days=1))
+    if frame.empty:
+        return pd.Series(dtype="float64", name="Close")
+    if interval != "1d" and days == 1:
+        s = frame["Close"].loc[frame.index < end_inclusive]
         if not s.empty:
-            return s
+            last_session = s.index.normalize().max()
+            s = s[s.index.normalize() == last_session]
+    else:
+        s = frame["Close"].loc[(frame.index >= pd.Timestamp(start)) & (frame.index < end_inclusive)]
+    s = s.copy()
+    s.name = "Close"
+    return s
+
+# ------------------------------------------------------------
+# Shared cache (all gunicorn workers on a host, or a Redis fleet)
+# ------------------------------------------------------------
+class SqliteCache:
+    """
+    Key -> bytes store with expiry in one SQLite file (WAL), safe for many
+    processes and threads: each thread of each process opens its own
+    connection, and every write is a single atomic upsert.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._local = threading.local()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, expires REAL, value BLOB)")
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def get(self, key: str) -> bytes | None:
+        row = self._conn().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        conn = self._conn()
+        conn.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)", (key, time.time() + ttl, value))
+        if random.random() < 0.01:
+            conn.execute("DELETE FROM cache WHERE expires <= ?", (time.time(),))
+
+class RedisCache:
+    """Same interface on any Redis-protocol server (Redis, Valkey, KeyDB, ...)."""
+
+    def __init__(self, url: str):
+        import redis  # optional dependency, only needed for redis:// URLs
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> bytes | None:
+        return self._client.get(key)
+
+    def set(self, key: str, value: bytes, ttl: float) -> None:
+        self._client.set(key, value, px=max(int(ttl * 1000), 1))
+
+def shared_cache_from_env():
+    """
+    SHARED_CACHE_URL picks the backend: unset -> SQLite file in the history
+    cache dir, "sqlite:///path" -> that file, "redis://..." -> Redis,
+    "none" -> per-process caching only.
+    """
+    url = os.environ.get("SHARED_CACHE_URL", "")
+    try:
+        if url.lower() == "none":
+            return None
+        if url.startswith(("redis://", "rediss://", "unix://")):
+            return RedisCache(url)
+        if url.startswith("sqlite:///"):
+            return SqliteCache(Path(url[len("sqlite:///"):]))
+        return SqliteCache(HISTORY_CACHE_DIR / "shared.sqlite")
     except Exception as e:
-        print(f"[fetch_history] download error: {e}", file=sys.stderr)
+        print(f"[shared_cache] disabled ({url or 'sqlite'}): {e}", file=sys.stderr)
+        return None
+
+shared_cache = shared_cache_from_env()
+
+def encode_series(s: pd.Series, expires_at: float) -> bytes:
+    """Expiry, then int64 ns timestamps, then float64 values: no pickle, so a shared backend cannot inject code."""
+    idx = np.asarray(s.index.values.astype("datetime64[ns]").view("i8"), dtype="<i8")
+    return struct.pack("<d", expires_at) + idx.tobytes() + np.asarray(s.to_numpy(), dtype="<f8").tobytes()
+
+def decode_series(blob: bytes) -> tuple[pd.Series, float]:
+    (expires_at,) = struct.unpack_from("<d", blob)
+    n = (len(blob) - 8) // 16
+    idx = np.frombuffer(blob, dtype="<i8", count=n, offset=8).astype("datetime64[ns]")
+    values = np.frombuffer(blob, dtype="<f8", count=n, offset=8 + 8 * n)
+    return pd.Series(values, index=pd.DatetimeIndex(idx), dtype="float64", name="Close" if n else None), expires_at
+
+# ------------------------------------------------------------
+# In-process memo cache (LRU by bytes + market-hours TTL)
+# ------------------------------------------------------------
+HISTORY_MEMO_MAX_BYTES = int(os.environ.get("HISTORY_MEMO_MAX_BYTES", 64 * 1024 * 1024))
+
+class MemoCache:
+    """
+    Thread-safe LRU of fetched series with per-entry expiry. The budget is in
+    bytes (index + values), so a few long intraday series cannot push out
+    hundreds of short daily ones the way a count-bounded LRU would.
+
+    With a `shared` backend, Series entries are written through under
+    `namespace` and local misses are filled from it, so every worker sees
+    what any one of them fetched.
+    """
+
+    def __init__(self, max_bytes: int, shared=None, namespace: str = "memo"):
+        self.max_bytes = max_bytes
+        self.shared, self.namespace = shared, namespace
+        self.nbytes = 0
+        self._entries: OrderedDict = OrderedDict()  # key -> (expires_at, nbytes, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                return entry[2]
+            if entry is not None:
+                self._drop(key)
+        return self._get_shared(key)
+
+    def put(self, key, value: pd.Series | pd.DataFrame, ttl: float) -> None:
+        if ttl <= 0:
+            return
+        self._put_local(key, value, time.time() + ttl)
+        if self.shared is not None and isinstance(value, pd.Series):
+            try:
+                self.shared.set(self._shared_key(key), encode_series(value, time.time() + ttl), ttl)
+            except Exception as e:
+                print(f"[shared_cache] write error: {e}", file=sys.stderr)
+
+    def _shared_key(self, key) -> str:
+        return "|".join([self.namespace, *map(str, key)])
+
+    def _get_shared(self, key):
+        if self.shared is None:
+            return None
+        try:
+            blob = self.shared.get(self._shared_key(key))
+        except Exception as e:
+            print(f"[shared_cache] read error: {e}", file=sys.stderr)
+            return None
+        if blob is None:
+            return None
+        value, expires_at = decode_series(blob)
+        self._put_local(key, value, expires_at)
+        return value
+
+    def _put_local(self, key, value: pd.Series | pd.DataFrame, expires_at: float) -> None:
+        usage = value.memory_usage(index=True)  # int for a Series, per-column for a DataFrame
+        nbytes = int(usage.sum() if isinstance(usage, pd.Series) else usage)
+        if nbytes > self.max_bytes or expires_at <= time.time():
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (expires_at, nbytes, value)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def items(self) -> list[tuple]:
+        """Unexpired local entries as (key, expires_at, value)."""
+        now = time.time()
+        with self._lock:
+            return [(key, e[0], e[2]) for key, e in self._entries.items() if e[0] > now]
 
-    # --- 2) Retry with .history(start/end) ---
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.nbytes = 0
+
+    def _drop(self, key) -> None:
+        self.nbytes -= self._entries.pop(key)[1]
+
+history_memo = MemoCache(HISTORY_MEMO_MAX_BYTES, shared=shared_cache, namespace="history")
+# (ticker, start, end, interval) keys that recently had no data at all
+NEGATIVE_TTL = float(os.environ.get("NEGATIVE_TTL", 60))
+negative_memo = MemoCache(1024 * 1024, shared=shared_cache, namespace="negative")
+
+# ------------------------------------------------------------
+# Series handles (fetch callback -> render callback)
+# ------------------------------------------------------------
+SERIES_HANDLE_TTL = float(os.environ.get("SERIES_HANDLE_TTL", 1800))
+series_store = MemoCache(HISTORY_MEMO_MAX_BYTES // 4, shared=shared_cache, namespace="series")
+
+def put_series(ticker: str, start: dt.date, end: dt.date, s: pd.Series) -> dict:
+    """
+    Keep `s` server-side and return the JSON handle the chart's dcc.Store
+    carries. The version is a digest of the bars, so a refresh that changes
+    the data changes the handle and a presentation change reuses it.
+    """
+    version = hashlib.blake2b(s.index.asi8.tobytes() + s.to_numpy(dtype="float64").tobytes(), digest_size=8).hexdigest()
+    key = (ticker, start.isoformat(), end.isoformat(), version)
+    series_store.put(key, s, SERIES_HANDLE_TTL)
+    return {"key": list(key), "ticker": ticker, "rows": len(s)}
+
+def get_series(handle: dict, local_only: bool = False) -> pd.Series | None:
+    """
+    Series behind a put_series handle, refetched if the store has dropped
+    it. With `local_only`, a refetch that would need Yahoo (pending_fetches)
+    returns None instead.
+    """
+    ticker, start, end, version = handle["key"]
+    s = series_store.get((ticker, start, end, version))
+    if s is None:
+        start, end = dt.date.fromisoformat(start), dt.date.fromisoformat(end)
+        if local_only and pending_fetches(ticker, start, end):
+            return None
+        s = fetch_history(ticker, start, end)
+    return s if len(s) else None
+
+# ------------------------------------------------------------
+# Memo snapshot (restored at boot so restarts start warm)
+# ------------------------------------------------------------
+MEMO_SNAPSHOT_PATH = Path(os.environ.get("MEMO_SNAPSHOT_PATH", HISTORY_CACHE_DIR.parent / "memo-snapshot.arrow"))
+MEMO_SNAPSHOT_EVERY = float(os.environ.get("MEMO_SNAPSHOT_EVERY", 300))  # seconds; 0 disables the timer
+
+def read_memo_snapshot(path: Path = MEMO_SNAPSHOT_PATH) -> list[tuple[tuple, float, pd.Series]]:
+    """
+    Memory-map an Arrow IPC snapshot and return its unexpired
+    (key, expires_at, series) entries. The series are zero-copy views
+    into the mapped file.
+    """
     try:
-        h = yf.Ticker(ticker).history(
-            start=start, end=end_inclusive, interval=interval, auto_adjust=False
-        )
-        s = to_close_series(h)
-        if not s.empty:
-            return s
+        table = pa.ipc.open_file(pa.memory_map(str(path))).read_all().combine_chunks()
+    except FileNotFoundError:
+        return []
     except Exception as e:
-        print(f"[fetch_history] history error: {e}", file=sys.stderr)
+        print(f"[snapshot] unreadable {path.name}: {type(e).__name__}: {e}", file=sys.stderr)
+        return []
+    if table.num_rows == 0:
+        return []
+    stamps_col, values_col = table.column("stamps").chunk(0), table.column("values").chunk(0)
+    offsets = stamps_col.offsets.to_numpy()
+    stamps = stamps_col.values.to_numpy(zero_copy_only=True)
+    values = values_col.values.to_numpy(zero_copy_only=True)
+    now = time.time()
+    entries = []
+    for i, (ticker, start, end, interval, expires_at) in enumerate(zip(*(
+        table.column(c).to_pylist() for c in ("ticker", "start", "end", "interval", "expires_at")
+    ))):
+        if expires_at <= now:
+            continue
+        lo, hi = offsets[i], offsets[i + 1]
+        s = pd.Series(values[lo:hi], index=pd.DatetimeIndex(stamps[lo:hi], name="Date"), name="Close", copy=False)
+        entries.append(((ticker, start, end, interval), expires_at, s))
+    return entries
+
+_snapshot_lock = threading.Lock()
+
+@contextmanager
+def _snapshot_file_lock(path: Path):
+    """
+    Serialize snapshot read-merge-writes: a thread lock within the process
+    (timer thread vs atexit) plus an flock across worker processes.
+    """
+    with _snapshot_lock:
+        if fcntl is None:
+            yield
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path.with_suffix(".lock"), "a") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fh, fcntl.LOCK_UN)
+
+def save_memo_snapshot(memo: MemoCache | None = None, path: Path = MEMO_SNAPSHOT_PATH) -> int:
+    """
+    Write the unexpired Series entries of `memo` (history_memo by default)
+    to `path` as one Arrow IPC file: key columns, expiry, and list columns
+    of timestamps and values. Entries already in the file are kept unless
+    the memo has a fresher copy, so workers snapshotting in turn add up
+    rather than overwrite each other (the merge and write run under
+    _snapshot_file_lock). Written atomically; returns the number of
+    entries saved.
+    """
+    memo = history_memo if memo is None else memo
+    with _snapshot_file_lock(path):
+        return _merge_memo_snapshot(memo, path)
+
+def _merge_memo_snapshot(memo: MemoCache, path: Path) -> int:
+    merged = {key: (expires_at, s) for key, expires_at, s in read_memo_snapshot(path)}
+    for key, expires_at, s in memo.items():
+        if isinstance(s, pd.Series) and expires_at >= merged.get(key, (0.0,))[0]:
+            merged[key] = (expires_at, s)
+    keys = list(merged)
+    series = [merged[k][1] for k in keys]
+    offsets = pa.array(np.concatenate([[0], np.cumsum([len(s) for s in series], dtype="int64")]).astype("int32"))
+    stamps = np.concatenate([s.index.values.astype("datetime64[ns]") for s in series]) if series else np.array([], "datetime64[ns]")
+    values = np.concatenate([s.to_numpy(dtype="float64") for s in series]) if series else np.array([], "float64")
+    table = pa.table({
+        "ticker": pa.array([k[0] for k in keys], pa.string()),
+        "start": pa.array([k[1] for k in keys], pa.date32()),
+        "end": pa.array([k[2] for k in keys], pa.date32()),
+        "interval": pa.array([k[3] for k in keys], pa.string()),
+        "expires_at": pa.array([merged[k][0] for k in keys], pa.float64()),
+        "stamps": pa.ListArray.from_arrays(offsets, pa.array(stamps, pa.timestamp("ns"))),
+        "values": pa.ListArray.from_arrays(offsets, pa.array(values, pa.float64())),
+    })
+    tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    with pa.OSFile(str(tmp), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, path)
+    return len(keys)
+
+def restore_memo_snapshot(memo: MemoCache | None = None, path: Path = MEMO_SNAPSHOT_PATH) -> int:
+    """Load the snapshot's unexpired entries into `memo` (history_memo by default); returns how many."""
+    memo = history_memo if memo is None else memo
+    entries = read_memo_snapshot(path)
+    for key, expires_at, s in entries:
+        memo._put_local(key, s, expires_at)
+    return len(entries)
 
-    # --- 3) Intraday fallback: period, then slice (and still handle 1D) ---
+def _save_memo_snapshot_quietly() -> None:
     try:
-        if interval != "1d":
-            period = "7d" if days <= 7 else "30d"
-            d2 = yf.download(
-                ticker, period=period, interval=interval,
-                progress=False, auto_adjust=False, threads=False,
-            )
-            s2 = to_close_series(d2)
-            if not s2.empty:
-                if days == 1:
-                    # same logic: pick last session with data
-                    last_session = s2.index.normalize().max()
-                    s2 = s2[s2.index.normalize() == last_session]
-                    if not s2.empty:
-                        return s2
-                else:
-                    # slice calendar window for multi-day intraday
-                    mask = (s2.index >= pd.Timestamp(start)) & (s2.index < pd.Timestamp(end_inclusive))
-                    s2 = s2.loc[mask]
-                    if not s2.empty:
-                        return s2
+        n = save_memo_snapshot()
+        print(f"[snapshot] saved {n} series", file=sys.stderr)
     except Exception as e:
-        print(f"[fetch_history] intraday period fallback error: {e}", file=sys.stderr)
+        print(f"[snapshot] write error: {type(e).__name__}: {e}", file=sys.stderr)
+
+_snapshot_state: dict = {}
+
+def _snapshot_loop() -> None:
+    while True:
+        time.sleep(MEMO_SNAPSHOT_EVERY)
+        _save_memo_snapshot_quietly()
+
+def start_snapshotter() -> None:
+    """Start the periodic snapshot thread once per process; the final snapshot is taken at exit."""
+    if MEMO_SNAPSHOT_EVERY <= 0 or _snapshot_state.get("pid") == os.getpid():
+        return
+    _snapshot_state["pid"] = os.getpid()
+    threading.Thread(target=_snapshot_loop, name="snapshot", daemon=True).start()
+
+# restored at import, so a preloading gunicorn master hands it to every worker
+if (_restored := restore_memo_snapshot()):
+    print(f"[snapshot] restored {_restored} series", file=sys.stderr)
+atexit.register(_save_memo_snapshot_quietly)
+
+# ------------------------------------------------------------
+# Shared price panel (mmap-backed, read zero-copy by every worker)
+# ------------------------------------------------------------
+PANEL_DIR = HISTORY_CACHE_DIR / "panel"
+
+def publish_price_panel(tickers: list[str], start: dt.date, end: dt.date, interval: str = "1d") -> None:
+    """
+    Write the cached Close series of `tickers` over [start, end] as one
+    tickers x timestamps float64 array (NaN where a ticker has no bar) plus
+    an int64 ns timestamp index, as .npy files that readers memory-map.
+    Each publish gets new versioned files and then atomically swaps the
+    manifest, so readers never see a half-written panel; files two
+    versions old are removed.
+    """
+    closes = {t: select_window(load_cached_frame(t, interval), start, end, interval) for t in tickers}
+    closes = {t: s for t, s in closes.items() if not s.empty}
+    if not closes:
+        return
+    panel = pd.concat(closes, axis=1).sort_index()
+    version = f"{time.time_ns()}-{os.getpid()}"
+    PANEL_DIR.mkdir(parents=True, exist_ok=True)
+    np.save(PANEL_DIR / f"{interval}.{version}.values.npy", np.ascontiguousarray(panel.to_numpy(dtype="float64").T))
+    np.save(PANEL_DIR / f"{interval}.{version}.index.npy", panel.index.values.astype("datetime64[ns]").view("i8"))
+    manifest = dict(
+        version=version, tickers=list(panel.columns), start=start.isoformat(), end=end.isoformat(),
+        fresh_until=time.time() + history_ttl(interval),
+    )
+    path = PANEL_DIR / f"{interval}.json"
+    old = json.loads(path.read_text()).get("version") if path.exists() else None
+    tmp = path.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(manifest))
+    os.replace(tmp, path)
+    for f in PANEL_DIR.glob(f"{interval}.*.npy"):
+        if f.name.split(".")[1] not in (version, old):
+            f.unlink(missing_ok=True)
+
+class PricePanel:
+    """
+    Read side of `publish_price_panel`. The arrays are np.load(mmap_mode="r")
+    views, so all workers share the same page-cache pages and per-worker RSS
+    does not grow with the ticker universe. The manifest is re-checked at
+    most every RECHECK seconds.
+    """
+
+    RECHECK = 2.0
+
+    def __init__(self, interval: str = "1d"):
+        self.interval = interval
+        self._panel = None  # (manifest, values, index, row by ticker)
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def _current(self):
+        with self._lock:
+            if time.monotonic() - self._checked < self.RECHECK:
+                return self._panel
+            self._checked = time.monotonic()
+            try:
+                manifest = json.loads((PANEL_DIR / f"{self.interval}.json").read_text())
+                if self._panel is None or self._panel[0]["version"] != manifest["version"]:
+                    prefix = PANEL_DIR / f"{self.interval}.{manifest['version']}"
+                    values = np.load(f"{prefix}.values.npy", mmap_mode="r")
+                    index = np.load(f"{prefix}.index.npy", mmap_mode="r").view("datetime64[ns]")
+                    self._panel = (manifest, values, index, {t: i for i, t in enumerate(manifest["tickers"])})
+            except FileNotFoundError:
+                self._panel = None
+            except Exception as e:
+                print(f"[price_panel] unreadable {self.interval} panel: {e}", file=sys.stderr)
+                self._panel = None
+            return self._panel
+
+    def series(self, ticker: str, start: dt.date, end: dt.date) -> pd.Series | None:
+        """Close series for [start, end] backed by the mapped panel, or None if the panel cannot serve it."""
+        panel = self._current()
+        if panel is None:
+            return None
+        manifest, values, index, rows = panel
+        if (ticker not in rows or time.time() >= manifest["fresh_until"]
+                or start < dt.date.fromisoformat(manifest["start"]) or end > dt.date.fromisoformat(manifest["end"])):
+            return None
+        lo, hi = np.searchsorted(index, [np.datetime64(start, "ns"), np.datetime64(end + dt.timedelta(days=1), "ns")])
+        row = values[rows[ticker], lo:hi]
+        s = pd.Series(row, index=pd.DatetimeIndex(index[lo:hi]), name="Close", copy=False)
+        return s.dropna() if np.isnan(row).any() else s
+
+price_panel = PricePanel("1d")
+
+# ------------------------------------------------------------
+# Single-flight: concurrent identical fetches share one download
+# ------------------------------------------------------------
+class SingleFlight:
+    """
+    Collapses concurrent calls with the same key into one execution. The
+    first caller runs `fn`; callers arriving while it is in flight block on
+    it and receive the same result (or exception).
+    """
+
+    def __init__(self):
+        self._calls: dict = {}  # key -> [done Event, result, exception]
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = [threading.Event(), None, None]
+        if not leader:
+            call[0].wait()
+            if call[2] is not None:
+                raise call[2]
+            return call[1]
+        try:
+            call[1] = fn()
+        except Exception as e:
+            call[2] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call[0].set()
+        return call[1]
+
+history_flights = SingleFlight()
+
+# ------------------------------------------------------------
+# Superseded chart requests (per browser session)
+# ------------------------------------------------------------
+CHART_DEBOUNCE = float(os.environ.get("CHART_DEBOUNCE", 0.15))  # seconds a chart request waits for a newer one
+
+class LatestRequests:
+    """
+    Newest request token per browser session. A chart request takes a
+    token with `begin` and checks `current` before each expensive step;
+    once a newer request from the same session has begun, the older one
+    stops. Tokens go through the shared cache when there is one, because
+    consecutive requests from a session can land on different workers
+    (or in a background job process).
+    """
+
+    TTL = 300.0
+    MAX_LOCAL = 10_000
+
+    def __init__(self, shared=None):
+        self.shared = shared
+        self._latest: OrderedDict = OrderedDict()  # session -> token
+        self._lock = threading.Lock()
+
+    def begin(self, session: str | None) -> str | None:
+        if not session:
+            return None
+        token = f"{time.time_ns()}-{os.getpid()}-{threading.get_ident()}"
+        with self._lock:
+            self._latest.pop(session, None)
+            self._latest[session] = token
+            while len(self._latest) > self.MAX_LOCAL:
+                self._latest.popitem(last=False)
+        if self.shared is not None:
+            try:
+                self.shared.set(f"latest|{session}", token.encode(), self.TTL)
+            except Exception as e:
+                print(f"[shared_cache] write error: {e}", file=sys.stderr)
+        return token
+
+    def current(self, session: str | None, token: str | None) -> bool:
+        if not session or token is None:
+            return True
+        latest = None
+        if self.shared is not None:
+            try:
+                blob = self.shared.get(f"latest|{session}")
+                latest = blob.decode() if blob else None
+            except Exception as e:
+                print(f"[shared_cache] read error: {e}", file=sys.stderr)
+        if latest is None:
+            with self._lock:
+                latest = self._latest.get(session)
+        return latest is None or latest == token
+
+chart_requests = LatestRequests(shared=shared_cache)
 
-    print(f"[fetch_history] no data for {ticker} {start}→{end} (interval {interval})", file=sys.stderr)
-    return pd.Series(dtype="float64")
+def _history_source(interval: str, start: dt.date, end: dt.date) -> tuple[str, dt.date]:
+    """Interval of the cached history a window is read from, and where that history should start."""
+    # download the widest window the interval serves once; narrower views slice it
+    source = _pyramid_source(interval, start) or interval
+    return source, min(start, end - dt.timedelta(days=FETCH_SPAN_DAYS[source]))
 
-def make_figure(s: pd.Series, ticker: str) -> go.Figure:
+def pending_fetches(ticker: str, start: dt.date, end: dt.date, refresh: bool = False) -> list[tuple[dt.date, dt.date]]:
+    """
+    Upstream downloads fetch_history would make for this window: missing
+    ranges plus the tail top-up, ending at `end`. Empty when it would be
+    answered from memory or disk, or at once because the breaker is open.
+    """
+    interval = pick_interval((end - start).days or 1)
+    key = (ticker, start, end, interval)
+    if yahoo_breaker.retry_in() or negative_memo.get(key) is not None:
+        return []
+    if not refresh and (history_memo.get(key) is not None
+                        or (interval == "1d" and price_panel.series(ticker, start, end) is not None)):
+        return []
+    source, fetch_start = _history_source(interval, start, end)
+    gaps, tail_since = _plan_fetch(load_cached_frame(ticker, source), fetch_start, end, refresh, market_now())
+    return gaps + ([(tail_since.date(), end)] if tail_since is not None else [])
+
+def fetch_history(ticker: str, start: dt.date, end: dt.date, refresh: bool = False) -> pd.Series:
+    """
+    Fetch Close series with a sensible interval, served from the in-process
+    memo cache, then the on-disk history cache, and topped up from Yahoo only
+    for missing bars. Each interval is cached over the widest window it
+    serves (FETCH_SPAN_DAYS), so narrower ranges are local slices, and
+    coarser bars (30m/60m inside the 5m history, 1w/1mo) are read from the
+    pre-aggregated pyramid.
+    Concurrent misses for the same window share one load, and windows that
+    just came back empty are answered from a short-lived negative cache.
+    `refresh=True` skips the memo and also pulls any bars newer than the
+    last cached one.
+    Returns tz-naive DatetimeIndex (minute-floor for intraday).
+    """
+    days = (end - start).days or 1
+    interval = pick_interval(days)
+    key = (ticker, start, end, interval)
+    if negative_memo.get(key) is not None:
+        return pd.Series(dtype="float64")
+    if not refresh:
+        s = history_memo.get(key)
+        if s is None and interval == "1d":
+            s = price_panel.series(ticker, start, end)
+        if s is not None:
+            return s
+
+    def load() -> pd.Series:
+        source, fetch_start = _history_source(interval, start, end)
+        frame, clean = cached_history(ticker, fetch_start, end, source, refresh=refresh,
+                                      session=days == 1 and source != "1d")
+        if source != interval:
+            frame = pyramid_frame(ticker, interval, frame)
+        s = select_window(frame, start, end, interval)
+        if s.empty:
+            print(f"[fetch_history] no data for {ticker} {start}→{end} (interval {interval})", file=sys.stderr)
+            s = pd.Series(dtype="float64")
+            if clean:
+                # upstream answered "no bars here"; failures and timeouts are not cached
+                negative_memo.put(key, s, NEGATIVE_TTL)
+            return s
+        history_memo.put(key, s, history_ttl(interval))
+        return s
+
+    # a refresh must not ride on a plain load (it would skip the forced tail pull), nor the reverse
+    return history_flights.do((*key, refresh), load)
+
+OVERLAY_WINDOWS = {"sma20": 20, "sma50": 50}
+CHART_MARGIN_PX = 56 + 24  # left + right plot margins in make_figure
+DEFAULT_CHART_WIDTH = 1200  # px, until the browser has reported the real width
+
+def downsample_indices(y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Positions of at most ~`max_points` samples of `y` that keep its shape:
+    the series is cut into max_points/2 equal runs and each run keeps its
+    lowest and highest sample (plus the first and last overall), so every
+    peak and trough a pixel column could show survives. Fully vectorized:
+    one lexsort per extreme, no per-bucket Python loop.
+    """
+    n = len(y)
+    if n <= max_points or max_points < 4:
+        return np.arange(n)
+    buckets = max_points // 2
+    edges = np.linspace(0, n, buckets + 1).astype(np.int64)
+    bucket = np.repeat(np.arange(buckets), np.diff(edges))
+    nan = np.isnan(y)
+    # sorted by (bucket, value), each bucket's first entry sits at its start edge
+    lows = np.lexsort((np.where(nan, np.inf, y), bucket))[edges[:-1]]
+    highs = np.lexsort((np.where(nan, np.inf, -y), bucket))[edges[:-1]]
+    return np.unique(np.concatenate(([0, n - 1], lows, highs)))
+
+def figure_parts(s: pd.Series, ticker: str, scale: str = "linear", kind: str = "line",
+                 overlays: list[str] | None = None, width: int | None = None) -> dict:
+    """
+    What a chart's figure owes to its data and the presentation controls:
+    the traces (as plain dicts, so patches skip plotly's validation), the
+    title, the x tick format, range-slider visibility and the y scale.
+    make_figure lays these over the fixed styling; patch_figure sends only
+    these to a chart that is already drawn.
+
+    `width` is the chart's pixel width in the browser; the series is cut to
+    about two samples per plot pixel (downsample_indices) so long windows
+    cost no more to ship and draw than short ones.
+    """
     df = s.to_frame(name="Close").reset_index()
     df.columns = ["Date", "Close"]
     df["Date"] = pd.to_datetime(df["Date"], utc=False)
@@ -272,70 +1815,121 @@ def make_figure(s: pd.Series, ticker: str) -> go.Figure:
         x_tickformat = "%b %d" if span_days <= 120 else "%b %Y"
         hover_fmt = "%b %d, %Y"
 
-    fig = go.Figure([
-        go.Scatter(
-            x=df["Date"],
-            y=df["Close"],
-            mode="lines+markers",
-            line=dict(width=2.2, color=ACCENT),
-            marker=dict(size=3.5, line=dict(width=0), color=ACCENT, opacity=0.9),
-            connectgaps=False,
-            hovertemplate=f"%{{x|{hover_fmt}}}<br>Close: $%{{y:.2f}}<extra></extra>",
-            name=f"{ticker} Close",
-        )
-    ])
+    # overlays come from the full series; only what is drawn is thinned
+    lines = {name: df["Close"].rolling(OVERLAY_WINDOWS[name], min_periods=OVERLAY_WINDOWS[name]).mean()
+             for name in overlays or []}
+    plot_px = max((width or DEFAULT_CHART_WIDTH) - CHART_MARGIN_PX, 100)
+    keep = downsample_indices(df["Close"].to_numpy(dtype="float64"), 2 * plot_px)
+    if len(keep) < len(df):
+        df = df.iloc[keep]
+        lines = {name: line.iloc[keep] for name, line in lines.items()}
 
-    # Unified hover card (vertical white line hidden via CSS)
-    fig.update_layout(
-        title=f"{ticker} Price Performance",
-        paper_bgcolor="rgba(0,0,0,0)",
-        plot_bgcolor="rgba(0,0,0,0)",
-        template=None,
-        hovermode="x unified",
-        hoverdistance=30,
-        spikedistance=-1,
-        margin=dict(l=56, r=24, t=60, b=56),
-        font=dict(color="#a5b4fc"),
-        hoverlabel=dict(
-            bgcolor="rgba(17,24,39,0.92)",
-            bordercolor="rgba(99,102,241,0.35)",
-            font=dict(color="#e5e7eb", size=12),
-            align="left",
-            namelength=-1,
-        ),
-        uirevision="keep",
-    )
+    # the shortest text plotly still reads as dates, and prices to 1/100 of a cent: the arrays are the payload
+    # (x as a list: orjson writes float arrays natively but not object ones)
+    x = df["Date"].dt.strftime("%Y-%m-%d %H:%M" if has_intraday_time else "%Y-%m-%d").tolist()
+    y = df["Close"].round(4).to_numpy()
+    traces = []
+    if kind == "area":
+        # fill down to the window's low rather than to zero, which would flatten the line
+        traces.append(dict(type="scatter", x=x, y=np.full(len(df), y.min()), mode="lines",
+                           line=dict(width=0), hoverinfo="skip", showlegend=False))
+    traces.append(dict(
+        type="scatter",
+        x=x,
+        y=y,
+        mode="lines" if kind == "area" else "lines+markers",
+        line=dict(width=2.2, color=ACCENT),
+        marker=dict(size=3.5, line=dict(width=0), color=ACCENT, opacity=0.9),
+        fill="tonexty" if kind == "area" else "none",
+        fillcolor="rgba(99,102,241,0.18)",
+        connectgaps=False,
+        hovertemplate=f"%{{x|{hover_fmt}}}<br>Close: $%{{y:.2f}}<extra></extra>",
+        name=f"{ticker} Close",
+    ))
+    for name, line in lines.items():
+        window = OVERLAY_WINDOWS[name]
+        traces.append(dict(
+            type="scatter",
+            x=x,
+            y=line.round(4).to_numpy(),
+            mode="lines",
+            line=dict(width=1.4, dash="dot"),
+            hovertemplate=f"SMA {window}: $%{{y:.2f}}<extra></extra>",
+            name=f"SMA {window}",
+        ))
+    return dict(data=traces, title=f"{ticker} Price Performance", x_tickformat=x_tickformat,
+                rangeslider=span_days > 60, scale=scale)
+
+def patch_figure(parts: dict, layout: bool = True) -> Patch:
+    """Patch turning a drawn make_figure chart into `parts`; `layout=False` leaves the axes alone but the tick format."""
+    patch = Patch()
+    patch["data"] = parts["data"]
+    patch["layout"]["xaxis"]["tickformat"] = parts["x_tickformat"]
+    if layout:
+        patch["layout"]["title"]["text"] = parts["title"]
+        patch["layout"]["xaxis"]["rangeslider"]["visible"] = parts["rangeslider"]
+        patch["layout"]["yaxis"]["type"] = parts["scale"]
+    return patch
 
+# Fixed styling, run through plotly's validators once at import; make_figure
+# only fills in the per-chart values, and dash serializes the plain dict with
+# orjson (plotly's "auto" JSON engine) without building a go.Figure.
+FIGURE_LAYOUT = go.Layout(
+    # Unified hover card (vertical white line hidden via CSS)
+    paper_bgcolor="rgba(0,0,0,0)",
+    plot_bgcolor="rgba(0,0,0,0)",
+    template=None,
+    hovermode="x unified",
+    hoverdistance=30,
+    spikedistance=-1,
+    margin=dict(l=56, r=24, t=60, b=56),
+    font=dict(color="#a5b4fc"),
+    hoverlabel=dict(
+        bgcolor="rgba(17,24,39,0.92)",
+        bordercolor="rgba(99,102,241,0.35)",
+        font=dict(color="#e5e7eb", size=12),
+        align="left",
+        namelength=-1,
+    ),
+    uirevision="keep",
     # Axes + weekend-only breaks (safer across time zones)
-    fig.update_xaxes(
+    xaxis=dict(
         type="date",
-        tickformat=x_tickformat,
         tickfont=dict(color="#a5b4fc"),
-        title_text="Date",
-        title_font=dict(color="#a5b4fc"),
+        title=dict(text="Date", font=dict(color="#a5b4fc")),
         gridcolor="rgba(99,102,241,0.08)",
         zeroline=False,
         showspikes=False,
-        rangeslider=dict(visible=span_days > 60),
         rangebreaks=[dict(bounds=["sat", "mon"])],
-    )
-    fig.update_yaxes(
+    ),
+    yaxis=dict(
         tickprefix="$",
         tickformat=".0f",
         tickfont=dict(color="#a5b4fc"),
-        title=dict(text="Close", standoff=20),
-        title_font=dict(color="#a5b4fc"),
+        title=dict(text="Close", standoff=20, font=dict(color="#a5b4fc")),
         gridcolor="rgba(99,102,241,0.08)",
         zeroline=False,
         showspikes=False,
-    )
+    ),
+).to_plotly_json() | {"template": {}}  # what template=None sent via go.Figure: no plotly defaults
 
-    return fig
+def make_figure(s: pd.Series, ticker: str, scale: str = "linear", kind: str = "line",
+                overlays: list[str] | None = None, width: int | None = None) -> dict:
+    """Figure dict for a series: figure_parts laid over FIGURE_LAYOUT (copied, never mutated)."""
+    parts = figure_parts(s, ticker, scale=scale, kind=kind, overlays=overlays, width=width)
+    layout = dict(FIGURE_LAYOUT, title=dict(text=parts["title"]))
+    layout["xaxis"] = dict(FIGURE_LAYOUT["xaxis"], tickformat=parts["x_tickformat"],
+                           rangeslider=dict(visible=parts["rangeslider"]))
+    layout["yaxis"] = dict(FIGURE_LAYOUT["yaxis"], type=parts["scale"])
+    return dict(data=parts["data"], layout=layout)
 
 # Window helpers
 RANGE_DAYS = {
     "1d": 1, "1w": 7, "1m": 30, "3m": 90, "6m": 180, "1y": 365, "2y": 730
 }
+# Calendar days downloaded per interval: the widest window pick_interval routes to it.
+# 5m takes everything Yahoo serves (~60 days) since 30m/60m views resample from it.
+FETCH_SPAN_DAYS = {"5m": 59, "30m": 10, "60m": 60, "1d": max(RANGE_DAYS.values())}
 def compute_window_endpoints(range_key: str, end_date: dt.date) -> tuple[dt.date, dt.date]:
     if (range_key or "").lower() == "1d":
         end_date = get_last_trading_day(end_date)
@@ -344,6 +1938,92 @@ def compute_window_endpoints(range_key: str, end_date: dt.date) -> tuple[dt.date
     days = RANGE_DAYS.get((range_key or "3m").lower(), 90)
     return end_date - dt.timedelta(days=days), end_date
 
+# ------------------------------------------------------------
+# Background prefetch (dropdown tickers x range options)
+# ------------------------------------------------------------
+PREFETCH_ENABLED = os.environ.get("PREFETCH", "1") != "0"
+PREFETCH_EVERY = float(os.environ.get("PREFETCH_EVERY", 300))  # seconds, while the market is open
+_prefetch_state: dict = {}
+
+def prefetch_once() -> None:
+    """
+    Warm the disk and memo caches for every dropdown ticker and every
+    range-select option, with the same windows update_chart will ask for,
+    then republish the shared daily price panel. Ranges sharing a
+    downloaded interval cost one batch call between them.
+    """
+    tickers = [o["value"] for o in TICKER_OPTIONS]
+    end = get_last_trading_day(dt.date.today())
+    for range_key in RANGE_DAYS:
+        start, end_ = compute_window_endpoints(range_key, end)
+        fetch_history_batch(tickers, start, end_)
+    publish_price_panel(tickers, end - dt.timedelta(days=FETCH_SPAN_DAYS["1d"]), end)
+
+def prefetch_delay(now: dt.datetime) -> float:
+    """Seconds until the next warm-up: every PREFETCH_EVERY while open (plus one pass just after the close), else at the next open."""
+    if is_market_open(now):
+        until_close = (dt.datetime.combine(now.date(), session_close(now.date())) - now).total_seconds()
+        return min(PREFETCH_EVERY, until_close + 60)
+    return (next_market_open(now) - now).total_seconds() + 30
+
+def _prefetch_loop() -> None:
+    # one prefetcher per host: workers queue on the lock, and the next one
+    # takes over if the leader's process exits
+    if fcntl is not None:
+        HISTORY_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        leader = open(HISTORY_CACHE_DIR / "prefetch.lock", "a")
+        fcntl.flock(leader, fcntl.LOCK_EX)
+    while True:
+        started = time.monotonic()
+        try:
+            prefetch_once()
+            print(f"[prefetch] warmed {len(TICKER_OPTIONS)} tickers in {time.monotonic() - started:.1f}s", file=sys.stderr)
+        except Exception as e:
+            print(f"[prefetch] error: {type(e).__name__}: {e}", file=sys.stderr)
+        time.sleep(max(prefetch_delay(market_now()), 1.0))
+
+def start_prefetcher() -> None:
+    """Start the prefetch daemon thread once per process (threads do not survive fork)."""
+    if not PREFETCH_ENABLED or _prefetch_state.get("pid") == os.getpid():
+        return
+    _prefetch_state["pid"] = os.getpid()
+    threading.Thread(target=_prefetch_loop, name="prefetch", daemon=True).start()
+
+@server.before_request
+def _ensure_prefetcher() -> None:
+    start_prefetcher()
+    start_snapshotter()
+
+# ------------------------------------------------------------
+# Preload warm start (gunicorn master, before workers fork)
+# ------------------------------------------------------------
+def warm_start() -> None:
+    """
+    Fill the history caches and the shared price panel, and load plotly's
+    lazily imported figure machinery by building the default chart once.
+    Called by gunicorn.conf.py in the master with preload_app, so forked
+    workers inherit all of it copy-on-write. gc.freeze() keeps the
+    collector from touching (and so un-sharing) those pages.
+    """
+    started = time.monotonic()
+    try:
+        prefetch_once()
+    except Exception as e:
+        print(f"[warm_start] prefetch error: {type(e).__name__}: {e}", file=sys.stderr)
+    end = get_last_trading_day(dt.date.today())
+    s = fetch_history(DEFAULT_TICKER, *compute_window_endpoints("3m", end))
+    if s.empty:
+        s = pd.Series([0.0, 0.0], index=pd.to_datetime([end - dt.timedelta(days=1), end]), name="Close")
+    to_json_plotly(make_figure(s, DEFAULT_TICKER))
+    to_json_plotly(go.Figure(layout=dict(title="")))
+    # retire the fetch threads here: fork drops their thread-local curl
+    # sessions in the child, and closing an inherited curl handle crashes
+    fetch_pool().shutdown(wait=True)
+    _fetch_pool_state.clear()
+    gc.collect()
+    gc.freeze()
+    print(f"[warm_start] ready in {time.monotonic() - started:.1f}s", file=sys.stderr)
+
 # ------------------------------------------------------------
 # Layout
 # ------------------------------------------------------------
@@ -365,17 +2045,7 @@ app.layout = html.Main(children=[
                     html.Label("Select Ticker", className="block text-sm font-medium mb-2 text-gray-700 dark:text-gray-300"),
                     dcc.Dropdown(
                         id="ticker",
-                        options=[
-                            {"label": "Apple (AAPL)", "value": "AAPL"},
-                            {"label": "Microsoft (MSFT)", "value": "MSFT"},
-                            {"label": "Alphabet (GOOGL)", "value": "GOOGL"},
-                            {"label": "Amazon (AMZN)", "value": "AMZN"},
-                            {"label": "NVIDIA (NVDA)", "value": "NVDA"},
-                            {"label": "Tesla (TSLA)", "value": "TSLA"},
-                            {"label": "Meta (META)", "value": "META"},
-                            {"label": "S&P 500 (SPY)", "value": "SPY"},
-                            {"label": "NASDAQ 100 (QQQ)", "value": "QQQ"},
-                        ],
+                        options=TICKER_OPTIONS,
                         value=DEFAULT_TICKER,
                         clearable=False,
                         className="dark:text-gray-900",
@@ -412,7 +2082,15 @@ app.layout = html.Main(children=[
                         ),
                         children="Update Chart",
                     ),
-                    html.Div(id="status", style={"display": "none"}),
+                    html.Div(id="status", style={"display": "none"},
+                             className="text-sm text-gray-600 dark:text-gray-400"),
+                    html.Button("Cancel", id="cancel-btn", n_clicks=0, style={"display": "none"},
+                                className="text-sm text-primary-300 hover:text-primary-500"),
+                    dcc.Store(id="fetch-job"),
+                    dcc.Store(id="series-handle"),
+                    dcc.Store(id="chart-width"),
+                    dcc.Store(id="chart-drawn", data=False),
+                    dcc.Store(id="session-id", storage_type="session"),
                 ]),
             ])
         ]
@@ -432,6 +2110,17 @@ app.layout = html.Main(children=[
                              html.Button("1Y", id="btn-1y", n_clicks=0, className="text-sm hover:text-primary-500"),
                          ])
                      ]),
+            html.Div(className="flex flex-wrap gap-6 mb-4 text-sm text-primary-300", children=[
+                dcc.RadioItems(id="chart-scale", value="linear", inline=True,
+                               options=[{"label": " Linear", "value": "linear"}, {"label": " Log", "value": "log"}],
+                               labelClassName="mr-3"),
+                dcc.RadioItems(id="chart-type", value="line", inline=True,
+                               options=[{"label": " Line", "value": "line"}, {"label": " Area", "value": "area"}],
+                               labelClassName="mr-3"),
+                dcc.Checklist(id="chart-overlays", value=[], inline=True,
+                              options=[{"label": " SMA 20", "value": "sma20"}, {"label": " SMA 50", "value": "sma50"}],
+                              labelClassName="mr-3"),
+            ]),
             dcc.Loading(
                 dcc.Graph(id="price-chart", config=graph_config, style={"height": "520px"}),
                 type="default"
@@ -476,30 +2165,258 @@ def set_quick_range(n1, n2, n3, n4):
         "btn-1y": "1y",
     }.get(trigger, dash.no_update)
 
+def chart_handle(t: str, range_key: str, start: dt.date, end: dt.date, s: pd.Series) -> tuple[dict, str]:
+    """Series handle and status line for a fetched series (an error title when it is empty)."""
+    if s is None or len(s) == 0:
+        retry_in = yahoo_breaker.retry_in()
+        if retry_in:
+            return {"title": "Market data source unavailable. Try again shortly."}, \
+                f"Upstream unavailable; retrying in {retry_in:.0f}s."
+        return {"title": f"No data for '{t}' in {start}→{end}. Try another range."}, f"No rows returned for {t}."
+    return put_series(t, start, end, s), f"Showing {t} – {range_key.upper()} window ({len(s)} rows)"
+
+class JobManager(dash.DiskcacheManager):
+    """
+    DiskcacheManager whose job processes are forked from a forkserver that
+    has imported this module but never opened a connection. Forking a web
+    worker directly copies the curl handles its fetch threads keep, and
+    the child crashes freeing them.
+    """
+
+    def call_job_fn(self, key, job_fn, args, context):
+        import multiprocess  # from dash[diskcache]
+        mp = multiprocess.get_context("forkserver")
+        mp.set_forkserver_preload([__name__])
+        process = mp.Process(target=job_fn, args=(key, self._make_progress_key(key), args, context))
+        process.start()
+        return process.pid
+
+def background_manager_from_env():
+    """
+    Dash background-callback manager for chart loads that must go to
+    Yahoo (BACKGROUND_FETCH=0 keeps every load on the request thread).
+    Jobs run in their own process and report through a diskcache
+    directory next to the history cache.
+    """
+    if os.environ.get("BACKGROUND_FETCH", "1") == "0":
+        return None
+    import diskcache  # optional dependency, from dash[diskcache]
+    return JobManager(diskcache.Cache(str(HISTORY_CACHE_DIR.parent / "jobs")), expire=600)
+
+background_manager = background_manager_from_env()
+
+# one id per browser tab, so chart requests can be matched to the ones they supersede
+app.clientside_callback(
+    """
+    function(_, sid) {
+        return sid || (window.crypto && crypto.randomUUID ? crypto.randomUUID() : String(Math.random()).slice(2));
+    }
+    """,
+    Output("session-id", "data"),
+    Input("session-id", "id"),
+    State("session-id", "data"),
+)
+
+def _drop_if_superseded(session: str | None, token: str | None) -> None:
+    if not chart_requests.current(session, token):
+        raise PreventUpdate
+
 @app.callback(
-    Output("price-chart", "figure"),
+    Output("series-handle", "data"),
     Output("status", "children"),
+    Output("fetch-job", "data"),
     Input("ticker", "value"),
     Input("range-select", "value"),
     Input("update-btn", "n_clicks"),
+    State("session-id", "data"),
 )
-def update_chart(ticker, range_key, _n):
+def update_chart(ticker, range_key, _n, session):
+    # clicking through the quick ranges fires one request per click; only the last one is worth building
+    token = chart_requests.begin(session)
+    if token is not None and CHART_DEBOUNCE > 0:
+        time.sleep(CHART_DEBOUNCE)
+    _drop_if_superseded(session, token)
     try:
         t = (ticker or "").strip().upper() or DEFAULT_TICKER
         end = get_last_trading_day(dt.date.today())
         start, end = compute_window_endpoints(range_key, end)
+        # "Update Chart" only needs the bars newer than what is cached
+        refresh = ctx.triggered_id == "update-btn"
 
-        s = fetch_history(t, start, end)
-        if s is None or len(s) == 0:
-            return go.Figure(layout=dict(
-                title=f"No data for '{t}' in {start}→{end}. Try another range."
-            )), f"No rows returned for {t}."
+        if background_manager is not None and pending_fetches(t, start, end, refresh):
+            # needs Yahoo: hand it to update_chart_background and keep this worker for cache hits
+            job = dict(ticker=t, range_key=range_key, start=start.isoformat(), end=end.isoformat(),
+                       refresh=refresh, session=session, token=token)
+            return dash.no_update, f"Fetching {t}…", job
+        s = fetch_history(t, start, end, refresh=refresh)
+        _drop_if_superseded(session, token)
+        return *chart_handle(t, range_key, start, end, s), dash.no_update
+    except PreventUpdate:
+        raise
+    except Exception as e:
+        return {"title": "Error"}, f"Error: {type(e).__name__}: {e}", dash.no_update
 
-        fig = make_figure(s, t)
-        msg = f"Showing {t} – {range_key.upper()} window ({len(s)} rows)"
-        return fig, msg
+# reports the chart's width (in 100px steps) now and on every resize, for render_chart's downsampling
+app.clientside_callback(
+    """
+    function(id) {
+        const measure = () => {
+            const el = document.getElementById("price-chart");
+            return el && el.clientWidth ? Math.round(el.clientWidth / 100) * 100 : null;
+        };
+        if (!window._chartWidthListener) {
+            let timer = null, last = null;
+            window._chartWidthListener = () => {
+                clearTimeout(timer);
+                timer = setTimeout(() => {
+                    const w = measure();
+                    if (w && w !== last) {
+                        last = w;
+                        dash_clientside.set_props(id, {data: w});
+                    }
+                }, 200);
+            };
+            window.addEventListener("resize", window._chartWidthListener);
+            setTimeout(window._chartWidthListener, 0);
+        }
+        return measure() || dash_clientside.no_update;
+    }
+    """,
+    Output("chart-width", "data"),
+    Input("chart-width", "id"),
+)
+
+@app.callback(
+    Output("price-chart", "figure"),
+    Output("chart-drawn", "data"),
+    Input("series-handle", "data"),
+    Input("chart-scale", "value"),
+    Input("chart-type", "value"),
+    Input("chart-overlays", "value"),
+    Input("chart-width", "data"),
+    State("chart-drawn", "data"),
+    prevent_initial_call=True,
+)
+def render_chart(handle, scale, kind, overlays, width, drawn):
+    """
+    Figure for a series handle; presentation changes land here without
+    refetching. Once a make_figure chart is on screen (`chart-drawn`), only
+    the traces, title and axis settings that change are sent, as a Patch.
+    """
+    if not handle:
+        raise PreventUpdate
+    if "title" in handle:
+        return go.Figure(layout=dict(title=handle["title"])), False
+    if drawn and list(ctx.triggered_prop_ids) == ["chart-scale.value"]:
+        patch = Patch()
+        patch["layout"]["yaxis"]["type"] = scale
+        return patch, True
+    try:
+        s = get_series(handle)
+        if s is None:
+            return go.Figure(layout=dict(title=f"No data for '{handle['ticker']}'. Try another range.")), False
+        if drawn:
+            return patch_figure(figure_parts(s, handle["ticker"], scale=scale, kind=kind, overlays=overlays,
+                                             width=width)), True
+        return make_figure(s, handle["ticker"], scale=scale, kind=kind, overlays=overlays, width=width), True
     except Exception as e:
-        return go.Figure(layout=dict(title="Error")), f"Error: {type(e).__name__}: {e}"
+        return go.Figure(layout=dict(title=f"Error: {type(e).__name__}: {e}")), False
+
+INTERVAL_ORDER = ("5m", "30m", "60m", "1d", "1w", "1mo")  # finest first
+ZOOM_LOOKBACK = max(OVERLAY_WINDOWS.values())  # bars kept left of the view so overlays start warmed up
+
+def detail_series(handle: dict, x0: pd.Timestamp, x1: pd.Timestamp) -> pd.Series | None:
+    """
+    The finest local bars for the visible [x0, x1] of a chart: the handle's
+    own series at full resolution, or, when the zoomed span maps to a finer
+    interval whose history (or pyramid level) is already on disk, that one.
+    Never downloads; a zoom that would need Yahoo keeps the current bars.
+    """
+    s = get_series(handle, local_only=True)
+    if s is None:
+        return None
+    ticker, start, end, _ = handle["key"]
+    current = pick_interval((dt.date.fromisoformat(end) - dt.date.fromisoformat(start)).days or 1)
+    d0, d1 = x0.date(), x1.date()
+    finer = pick_interval((d1 - d0).days or 1)
+    if INTERVAL_ORDER.index(finer) < INTERVAL_ORDER.index(current) and not pending_fetches(ticker, d0, d1):
+        fine = fetch_history(ticker, d0, d1)
+        if len(fine) > 1:
+            s = fine
+    i0 = max(s.index.searchsorted(x0) - ZOOM_LOOKBACK, 0)
+    i1 = s.index.searchsorted(x1, side="right") + 1  # one bar past the edge so the line reaches it
+    return s.iloc[i0:i1]
+
+@app.callback(
+    Output("price-chart", "figure", allow_duplicate=True),
+    Input("price-chart", "relayoutData"),
+    State("series-handle", "data"),
+    State("chart-scale", "value"),
+    State("chart-type", "value"),
+    State("chart-overlays", "value"),
+    State("chart-width", "data"),
+    prevent_initial_call=True,
+)
+def zoom_chart(relayout, handle, scale, kind, overlays, width):
+    """
+    On an x zoom, swap the traces for the finest local bars of the visible
+    window (detail_series); on reset, back to the whole window. Only the
+    trace data (and tick format) is patched, so the zoom itself stays put.
+    """
+    if not relayout or not handle or "key" not in handle:
+        raise PreventUpdate
+    if "xaxis.range[0]" in relayout:
+        x0, x1 = relayout["xaxis.range[0]"], relayout["xaxis.range[1]"]
+    elif "xaxis.range" in relayout:
+        x0, x1 = relayout["xaxis.range"]
+    elif relayout.get("xaxis.autorange"):
+        x0 = x1 = None
+    else:
+        raise PreventUpdate
+    s = get_series(handle, local_only=True) if x0 is None else detail_series(handle, pd.Timestamp(x0), pd.Timestamp(x1))
+    if s is None or len(s) < 2:
+        raise PreventUpdate
+    # the range slider and scale stay as the full window set them
+    return patch_figure(figure_parts(s, handle["ticker"], scale=scale, kind=kind, overlays=overlays, width=width),
+                        layout=False)
+
+def update_chart_background(set_progress, job):
+    """Slow chart loads, run by background_manager with progress in the status line."""
+    if not job:
+        raise PreventUpdate
+    session, token = job.get("session"), job.get("token")
+    _drop_if_superseded(session, token)
+    try:
+        t, range_key, refresh = job["ticker"], job["range_key"], job["refresh"]
+        start, end = dt.date.fromisoformat(job["start"]), dt.date.fromisoformat(job["end"])
+        pending = pending_fetches(t, start, end, refresh)
+        if pending:
+            set_progress(f"Downloading {t}: {len(pending)} missing range(s), {pending[0][0]}→{pending[-1][1]}…")
+        s = fetch_history(t, start, end, refresh=refresh)
+        _drop_if_superseded(session, token)
+        return chart_handle(t, range_key, start, end, s)
+    except PreventUpdate:
+        raise
+    except Exception as e:
+        return {"title": "Error"}, f"Error: {type(e).__name__}: {e}"
+
+if background_manager is not None:
+    # registered without rebinding the name, so job processes unpickle it by reference
+    app.callback(
+        Output("series-handle", "data", allow_duplicate=True),
+        Output("status", "children", allow_duplicate=True),
+        Input("fetch-job", "data"),
+        background=True,
+        manager=background_manager,
+        progress=Output("status", "children"),
+        running=[
+            (Output("status", "style"), {"display": "block"}, {"display": "none"}),
+            (Output("cancel-btn", "style"), {"display": "inline"}, {"display": "none"}),
+            (Output("update-btn", "disabled"), True, False),
+        ],
+        cancel=Input("cancel-btn", "n_clicks"),
+        prevent_initial_call=True,
+    )(update_chart_background)
 
 if __name__ == "__main__":
     app.run(debug=True)